@@ -7,23 +7,25 @@ Complete examples showing all features and usage patterns
 import os
 import sys
 import json
+import logging
+import asyncio
 from pathlib import Path
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
 
-from src.prompt_optimizer import PromptOptimizer
-from src.image_generator import ImageGenerator
-from src.image_processor import ImageProcessor
-from src.style_presets import get_style_list
-
-# Get API key from environment
+# Get API key from environment (checked before the heavy imports so a missing key fails fast)
 API_KEY = os.getenv("OPENAI_API_KEY")
 if not API_KEY:
     print("Please set your OPENAI_API_KEY environment variable")
     sys.exit(1)
 
-def example_basic_generation():
+from src.prompt_optimizer import PromptOptimizer
+from src.image_generator import ImageGenerator
+from src.image_processor import ImageProcessor
+from src.style_presets import get_style_list
+
+async def example_basic_generation():
     """Example 1: Basic image generation with style preset"""
     print("\n" + "="*60)
     print("EXAMPLE 1: Basic Image Generation")
@@ -37,19 +39,23 @@ def example_basic_generation():
     prompt = "A serene Japanese garden with koi pond"
     print(f"Original prompt: {prompt}")
     
+    # Connect to the image API while the prompt is being enhanced
+    warm_up = asyncio.create_task(generator.warm_up())
+    
     # Enhance the prompt
-    enhanced_prompt, negative_prompt, metadata = optimizer.enhance_prompt(
+    enhanced_prompt, negative_prompt, metadata = await optimizer.enhance_prompt_async(
         prompt=prompt,
         style_preset="photorealistic",
-        optimize_prompt=True
+        use_gpt_enhancement=True
     )
+    await warm_up
     
     print(f"\nEnhanced prompt: {enhanced_prompt}")
     if negative_prompt:
         print(f"Negative prompt: {negative_prompt}")
     
     # Generate image
-    result = generator.generate_image(
+    result = await generator.generate_image_async(
         prompt=enhanced_prompt,
         size="1024x1024",
         quality="high"
@@ -58,7 +64,6 @@ def example_basic_generation():
     if result["success"]:
         # Save the image
         output_path = "output/example1_japanese_garden.png"
-        os.makedirs("output", exist_ok=True)
         generator.save_image(result["images"][0]["b64_json"], output_path)
         print(f"\n✅ Image saved to: {output_path}")
     else:
@@ -66,8 +71,8 @@ def example_basic_generation():
     
     return result
 
-def example_multiple_styles():
-    """Example 2: Generate same subject in multiple styles"""
+async def example_multiple_styles():
+    """Example 2: Generate same subject in multiple styles (concurrently)"""
     print("\n" + "="*60)
     print("EXAMPLE 2: Multiple Style Variations")
     print("="*60)
@@ -79,33 +84,33 @@ def example_multiple_styles():
     base_prompt = "A majestic phoenix rising from flames"
     styles = ["photorealistic", "anime", "oil_painting", "3d_render", "watercolor"]
     
-    results = []
-    for style in styles:
-        print(f"\n🎨 Generating {style} version...")
-        
-        # Enhance with specific style
-        enhanced_prompt, _, _ = optimizer.enhance_prompt(
+    # Enhance the prompt for every style concurrently
+    enhanced = await asyncio.gather(*(
+        optimizer.enhance_prompt_async(
             prompt=base_prompt,
             style_preset=style,
-            optimize_prompt=True
-        )
-        
-        # Generate image
-        result = generator.generate_image(
-            prompt=enhanced_prompt,
-            size="1024x1024",
-            quality="medium"
+            use_gpt_enhancement=True
         )
-        
+        for style in styles
+    ))
+    
+    # All styles are generated concurrently, each reported as soon as it finishes
+    print(f"\n🎨 Generating {len(styles)} style versions...")
+    results = []
+    async for i, result in generator.iter_generate_async(
+        [enhanced_prompt for enhanced_prompt, _, _ in enhanced],
+        size="1024x1024",
+        quality="medium"
+    ):
+        style = styles[i]
         if result["success"]:
             # Save with style name
             output_path = f"output/example2_phoenix_{style}.png"
-            os.makedirs("output", exist_ok=True)
             generator.save_image(result["images"][0]["b64_json"], output_path)
-            print(f"   ✅ Saved to: {output_path}")
+            print(f"   ✅ {style}: saved to {output_path}")
             results.append({"style": style, "path": output_path})
         else:
-            print(f"   ❌ Failed: {result.get('error')}")
+            print(f"   ❌ {style}: {result.get('error')}")
     
     return results
 
@@ -140,14 +145,13 @@ def example_anime_style():
     
     if result["success"]:
         output_path = "output/example3_ghibli_castle.png"
-        os.makedirs("output", exist_ok=True)
         generator.save_image(result["images"][0]["b64_json"], output_path)
         print(f"\n✅ Ghibli-style image saved to: {output_path}")
     
     return result
 
-def example_concept_art():
-    """Example 4: Game concept art with multiple variations"""
+async def example_concept_art():
+    """Example 4: Game concept art with multiple variations (concurrently)"""
     print("\n" + "="*60)
     print("EXAMPLE 4: Game Concept Art")
     print("="*60)
@@ -159,20 +163,28 @@ def example_concept_art():
     
     # Generate multiple variations
     variations = optimizer.suggest_variations(prompt, num_variations=3)
-    
-    results = []
     for i, varied_prompt in enumerate(variations, 1):
         print(f"\n🎮 Variation {i}: {varied_prompt[:100]}...")
-        
-        result = generator.generate_image(
-            prompt=varied_prompt,
-            size="1024x1024",
-            quality="high"
-        )
-        
-        if result["success"]:
+    
+    # Variations are independent, generate them all at once
+    generated = await asyncio.gather(
+        *(
+            generator.generate_image_async(
+                prompt=varied_prompt,
+                size="1024x1024",
+                quality="high"
+            )
+            for varied_prompt in variations
+        ),
+        return_exceptions=True
+    )
+    
+    results = []
+    for i, result in enumerate(generated, 1):
+        if isinstance(result, Exception):
+            print(f"   ❌ Variation {i}: {result}")
+        elif result["success"]:
             output_path = f"output/example4_concept_art_v{i}.png"
-            os.makedirs("output", exist_ok=True)
             generator.save_image(result["images"][0]["b64_json"], output_path)
             print(f"   ✅ Saved to: {output_path}")
             results.append(output_path)
@@ -211,7 +223,6 @@ def example_custom_style():
     
     if result["success"]:
         output_path = "output/example5_steampunk_lab.png"
-        os.makedirs("output", exist_ok=True)
         generator.save_image(result["images"][0]["b64_json"], output_path)
         print(f"\n✅ Custom style image saved to: {output_path}")
     
@@ -273,7 +284,6 @@ def example_edit_with_reference():
     
     if result["success"]:
         output_path = "output/example7_edited_with_sunset.png"
-        os.makedirs("output", exist_ok=True)
         generator.save_image(result["images"][0]["b64_json"], output_path)
         print(f"\n✅ Edited image saved to: {output_path}")
     else:
@@ -317,7 +327,6 @@ def example_mask_editing():
     
     if result["success"]:
         output_path = "output/example8_masked_edit.png"
-        os.makedirs("output", exist_ok=True)
         generator.save_image(result["images"][0]["b64_json"], output_path)
         print(f"\n✅ Masked edit saved to: {output_path}")
     
@@ -331,8 +340,8 @@ def example_list_all_styles():
     
     styles = get_style_list()
     
-    print(f"\n📚 Total styles available: {len(styles)}")
-    print("\nCategories:")
+    # Collect the listing and print it in one write
+    lines = [f"\n📚 Total styles available: {len(styles)}", "\nCategories:"]
     
     # Group styles by category (simplified)
     categories = {
@@ -344,27 +353,38 @@ def example_list_all_styles():
         "Historical": ["renaissance", "baroque", "impressionism", "art_nouveau", "gothic"]
     }
     
+    styles_set = set(styles)
     for category, style_list in categories.items():
-        available = [s for s in style_list if s in styles]
+        available = [s for s in style_list if s in styles_set]
         if available:
-            print(f"\n{category}:")
-            for style in available:
-                print(f"  - {style}")
+            lines.append(f"\n{category}:")
+            lines.extend(f"  - {style}" for style in available)
     
     # Show remaining styles
-    shown_styles = set(sum(categories.values(), []))
+    shown_styles = set().union(*categories.values())
     remaining = [s for s in styles if s not in shown_styles]
     if remaining:
-        print(f"\nOther styles ({len(remaining)}):")
-        for i in range(0, min(10, len(remaining))):
-            print(f"  - {remaining[i]}")
+        lines.append(f"\nOther styles ({len(remaining)}):")
+        lines.extend(f"  - {style}" for style in remaining[:10])
         if len(remaining) > 10:
-            print(f"  ... and {len(remaining) - 10} more")
+            lines.append(f"  ... and {len(remaining) - 10} more")
+    
+    print("\n".join(lines))
     
     return styles
 
+def run_example(func):
+    """Run an example function, driving async examples with asyncio"""
+    if asyncio.iscoroutinefunction(func):
+        return asyncio.run(func())
+    return func()
+
 def main():
     """Run all examples"""
+    # Show library messages (crop info, enhancement fallbacks) as plain console lines
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logging.getLogger("src").setLevel(logging.INFO)
+    
     print("\n" + "🎨"*30)
     print(" BETTER GPT IMAGE - PYTHON EXAMPLES")
     print("🎨"*30)
@@ -398,14 +418,14 @@ def main():
             # Run all examples
             for name, func in examples:
                 try:
-                    func()
+                    run_example(func)
                 except Exception as e:
                     print(f"\n❌ Error in {name}: {e}")
         elif choice.isdigit() and 1 <= int(choice) <= len(examples):
             # Run selected example
             idx = int(choice) - 1
             name, func = examples[idx]
-            func()
+            run_example(func)
         else:
             print("Invalid choice")
     
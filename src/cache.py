@@ -0,0 +1,396 @@
+"""
+Result Cache for Better GPT Image
+Content-addressed caching of prompt enhancements and generated images
+"""
+
+import asyncio
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Optional, Sequence, Tuple, Union
+
+# numpy is imported where it is used, only SemanticCache needs it
+if TYPE_CHECKING:
+    import numpy as np
+
+# orjson is optional, cached entries (which can hold multi-MB base64 images) are
+# read and written considerably faster with it
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Marks a memory-layer miss (None is a valid cached value)
+_MISS = object()
+
+
+def encode_json(value: Any) -> bytes:
+    """Serialize a value to JSON bytes, with orjson when installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value)
+    return json.dumps(value).encode("utf-8")
+
+
+def decode_json(data: bytes) -> Any:
+    """Parse JSON bytes, with orjson when installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def cache_key(params: Dict[str, Any]) -> str:
+    """Build a deterministic SHA-256 key from a dict of call parameters"""
+    # Stdlib json keeps keys identical whether or not orjson is installed
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """In-memory LRU cache in front of an optional on-disk store (one JSON file per key)"""
+    
+    def __init__(
+        self,
+        cache_dir: Optional[Union[str, Path]] = None,
+        maxsize: int = 0,
+        max_bytes: Optional[int] = None
+    ):
+        """
+        Args:
+            cache_dir: Directory for persistent entries (None keeps the cache in memory only)
+            maxsize: Number of entries kept in memory (0 disables the memory layer)
+            max_bytes: Size limit of the on-disk store, least recently used entries
+                are evicted past it (default: BGI_CACHE_MAX_MB or 256 MB, 0 for no limit)
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.maxsize = maxsize
+        if max_bytes is None:
+            max_bytes = int(os.getenv("BGI_CACHE_MAX_MB", "256")) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._disk_bytes = None  # Measured on first write
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+    
+    def _remember(self, key: str, value: Any) -> None:
+        if not self.maxsize:
+            return
+        # Stored and returned as copies, so callers mutating a result cannot change later hits
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            if len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+    
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Look up a cached value
+        
+        Returns:
+            Tuple of (hit, value)
+        """
+        if self.maxsize:
+            with self._lock:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    value = self._memory[key]
+                else:
+                    value = _MISS
+            if value is not _MISS:
+                return True, copy.deepcopy(value)
+        
+        if self.cache_dir is None:
+            return False, None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = decode_json(f.read())
+            # Mark as recently used for eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return False, None
+        
+        self._remember(key, value)
+        return True, value
+    
+    def set(self, key: str, value: Any) -> None:
+        """Store a value, writing files atomically so readers never see partial files"""
+        self._remember(key, value)
+        if self.cache_dir is None:
+            return
+        
+        path = self._path(key)
+        tmp_path = None
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Unique temp name, concurrent writers of the same key never share a file
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as f:
+                tmp_path = f.name
+                f.write(encode_json(value))
+            
+            if self.max_bytes:
+                with self._lock:
+                    if self._disk_bytes is None:
+                        self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+                    self._disk_bytes += os.path.getsize(tmp_path)
+                    if path.exists():
+                        self._disk_bytes -= path.stat().st_size
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # A cache that cannot be written must not lose the result it was given
+            logger.warning("Failed to write cache entry %s: %s", key, e)
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return
+        
+        if self.max_bytes and self._disk_bytes > self.max_bytes:
+            self._evict()
+    
+    def _disk_entries(self):
+        """List (mtime, size, path) of every stored entry"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+    
+    def _evict(self) -> None:
+        """Delete least recently used entries until the store fits in max_bytes"""
+        with self._lock:
+            entries = sorted(self._disk_entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(entry_path)
+                except OSError:
+                    continue
+                total -= size
+            self._disk_bytes = total
+
+
+class SemanticCache:
+    """
+    In-memory LRU of results keyed by embedding, matching near-duplicate inputs
+    
+    Entries only match within the same group (e.g. style and model), and only
+    when the cosine similarity of the embeddings reaches the threshold.
+    """
+    
+    def __init__(self, threshold: float = 0.95, maxsize: int = 10000):
+        import numpy as np
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._vectors = None  # (maxsize, dim) unit vectors, allocated on first set
+        self._groups = np.zeros(maxsize, dtype=np.int64)
+        self._last_used = np.zeros(maxsize, dtype=np.int64)
+        self._results = [None] * maxsize
+        self._group_ids = {}
+        self._count = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> "np.ndarray":
+        import numpy as np
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def get(self, embedding: Sequence[float], group: Hashable) -> Optional[Any]:
+        """Return the result of the most similar entry in the group, or None below the threshold"""
+        import numpy as np
+        query = self._unit(embedding)
+        with self._lock:
+            group_id = self._group_ids.get(group)
+            if group_id is None or self._vectors is None or len(query) != self._vectors.shape[1]:
+                return None
+            n = self._count
+            similarities = self._vectors[:n] @ query
+            similarities[self._groups[:n] != group_id] = -1.0
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            self._clock += 1
+            self._last_used[best] = self._clock
+            return self._results[best]
+    
+    def set(self, embedding: Sequence[float], group: Hashable, result: Any) -> None:
+        """Store a result, evicting the least recently used entry when full"""
+        import numpy as np
+        vector = self._unit(embedding)
+        with self._lock:
+            if self._vectors is None or len(vector) != self._vectors.shape[1]:
+                # First entry, or the embedding model changed: start over
+                self._vectors = np.empty((self.maxsize, len(vector)), dtype=np.float32)
+                self._count = 0
+            if self._count < self.maxsize:
+                row = self._count
+                self._count += 1
+            else:
+                row = int(np.argmin(self._last_used))
+            self._clock += 1
+            self._vectors[row] = vector
+            self._groups[row] = self._group_ids.setdefault(group, len(self._group_ids))
+            self._last_used[row] = self._clock
+            self._results[row] = result
+
+
+class _Flight:
+    """A sync call in progress that identical concurrent calls wait for"""
+    
+    __slots__ = ("done", "stored", "result")
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.stored = False
+        self.result = None
+
+
+def cached(
+    namespace: str,
+    key_extra: Optional[Callable[[Any], Dict[str, Any]]] = None,
+    should_cache: Optional[Callable[[Any], bool]] = None,
+    restore: Optional[Callable[[Any], Any]] = None
+):
+    """
+    Cache a method's results in the instance's `result_cache`
+    
+    The key covers the namespace and every bound argument (defaults included),
+    plus anything returned by key_extra(self) such as model or prompt versions.
+    Caching is skipped when the instance has no result_cache. Works for both
+    regular and async methods.
+    
+    Concurrent identical calls are coalesced: while one is running, the others
+    wait for it and share its result once stored (if it is not cacheable, they
+    make their own calls).
+    
+    Args:
+        namespace: Name separating this method's entries from others
+        key_extra: Optional callable adding instance state to the key
+        should_cache: Optional predicate deciding whether a result is stored
+        restore: Optional callable converting a loaded JSON value back
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        
+        def make_key(self, args, kwargs) -> str:
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            params.pop("self", None)
+            params["_namespace"] = namespace
+            if key_extra:
+                params["_extra"] = key_extra(self)
+            return cache_key(params)
+        
+        def load(cache, key):
+            hit, value = cache.get(key)
+            if hit and restore:
+                value = restore(value)
+            return hit, value
+        
+        def store(cache, key, result) -> bool:
+            if should_cache is None or should_cache(result):
+                cache.set(key, result)
+                return True
+            return False
+        
+        # Calls in progress, by (event loop,) cache and key: a future of (stored, result)
+        # for async calls, an event set once _Flight.stored/result are filled for sync ones
+        inflight = {}
+        inflight_lock = threading.Lock()
+        
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                cache = getattr(self, "result_cache", None)
+                if cache is None:
+                    return await func(self, *args, **kwargs)
+                
+                # Disk access runs in a worker thread to keep the event loop free
+                loop = asyncio.get_running_loop()
+                key = make_key(self, args, kwargs)
+                hit, value = await loop.run_in_executor(None, load, cache, key)
+                if hit:
+                    return value
+                
+                # Futures belong to one loop, so each loop coalesces its own calls
+                flight_key = (id(loop), id(cache), key)
+                flight = inflight.get(flight_key)
+                if flight is not None:
+                    stored, result = await asyncio.shield(flight)
+                    if stored:
+                        return copy.deepcopy(result)
+                    return await func(self, *args, **kwargs)
+                
+                flight = inflight[flight_key] = loop.create_future()
+                outcome = (False, None)
+                try:
+                    result = await func(self, *args, **kwargs)
+                    stored = await loop.run_in_executor(None, store, cache, key, result)
+                    outcome = (stored, result)
+                    return result
+                finally:
+                    del inflight[flight_key]
+                    flight.set_result(outcome)
+            
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, "result_cache", None)
+            if cache is None:
+                return func(self, *args, **kwargs)
+            
+            key = make_key(self, args, kwargs)
+            hit, value = load(cache, key)
+            if hit:
+                return value
+            
+            flight_key = (id(cache), key)
+            with inflight_lock:
+                flight = inflight.get(flight_key)
+                leader = flight is None
+                if leader:
+                    flight = inflight[flight_key] = _Flight()
+            if not leader:
+                flight.done.wait()
+                if flight.stored:
+                    return copy.deepcopy(flight.result)
+                return func(self, *args, **kwargs)
+            
+            try:
+                result = func(self, *args, **kwargs)
+                flight.stored = store(cache, key, result)
+                flight.result = result
+                return result
+            finally:
+                with inflight_lock:
+                    del inflight[flight_key]
+                flight.done.set()
+        
+        return wrapper
+    
+    return decorator
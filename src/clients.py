@@ -0,0 +1,69 @@
+"""
+Shared API Clients for Better GPT Image
+Reuses OpenAI clients (and their connection pools) across instances
+"""
+
+from functools import lru_cache
+from typing import Optional, Union
+
+import httpx
+from openai import AsyncOpenAI, OpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, DEFAULT_MAX_RETRIES, NOT_GIVEN
+
+# HTTP/2 lets concurrent async requests share one connection (needs the optional h2 package)
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+@lru_cache(maxsize=1)
+def _shared_http_client() -> DefaultHttpxClient:
+    """Process-wide HTTP client (SDK default limits and timeouts) behind every sync OpenAI client"""
+    return DefaultHttpxClient()
+
+
+@lru_cache(maxsize=8)
+def get_client(api_key: str, max_retries: int = DEFAULT_MAX_RETRIES) -> OpenAI:
+    """
+    Get a process-wide OpenAI client for an API key
+    
+    Every ImageGenerator and PromptOptimizer shares one HTTP connection pool,
+    even across API keys, so keep-alive connections are reused instead of
+    paying a new TCP/TLS handshake per instance.
+    
+    Args:
+        api_key: OpenAI API key
+        max_retries: Retries on rate limit / transient errors
+    
+    Returns:
+        Shared OpenAI client
+    """
+    if max_retries != DEFAULT_MAX_RETRIES:
+        # Copies keep the underlying HTTP client of the default one
+        return get_client(api_key).with_options(max_retries=max_retries)
+    return OpenAI(api_key=api_key, http_client=_shared_http_client())
+
+
+def new_async_client(
+    api_key: str,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    timeout: Optional[Union[float, httpx.Timeout]] = None
+) -> AsyncOpenAI:
+    """
+    Create an async OpenAI client, over HTTP/2 when h2 is installed
+    
+    Async connection pools are bound to the event loop they are first used in,
+    so these clients are not shared like get_client's.
+    
+    Args:
+        api_key: OpenAI API key
+        max_retries: Retries on rate limit / transient errors
+        timeout: Request timeout (default: the SDK's)
+    """
+    return AsyncOpenAI(
+        api_key=api_key,
+        max_retries=max_retries,
+        timeout=NOT_GIVEN if timeout is None else timeout,
+        http_client=DefaultAsyncHttpxClient(http2=HTTP2_AVAILABLE)
+    )
@@ -3,29 +3,341 @@ Image Generator for Better GPT Image
 Core image generation functionality using OpenAI's latest APIs
 """
 
-import base64
 import io
 import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Union, Any, AsyncGenerator
-from PIL import Image
-import aiohttp
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union, Any, AsyncGenerator
 import asyncio
-from openai import OpenAI
+import functools
+from .cache import ResultCache, cached, encode_json
+from .clients import get_client, new_async_client
+
+logger = logging.getLogger(__name__)
+
+# PIL and aiohttp are imported where they are used, so importing the generator
+# stays fast when no post-processing or URL downloads are needed
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from PIL import Image
+
+# pybase64 is an optional SIMD-accelerated drop-in for the base64 module,
+# images are encoded/decoded whole so this is on every generation's path
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+
+# (output tokens per image, direct per-image price in dollars) for gpt-image-1, by (size, quality)
+_COST_TABLE = {
+    ("1024x1024", "low"): (272, 0.011),
+    ("1024x1024", "medium"): (1056, 0.042),
+    ("1024x1024", "high"): (4160, 0.167),
+    ("1024x1536", "low"): (408, 0.016),
+    ("1024x1536", "medium"): (1584, 0.063),
+    ("1024x1536", "high"): (6240, 0.250),
+    ("1536x1024", "low"): (400, 0.016),
+    ("1536x1024", "medium"): (1568, 0.063),
+    ("1536x1024", "high"): (6208, 0.250),
+}
+
+# Display strings of the per-image prices, formatted once
+_PRICE_STR = {key: f"${price:.3f}" for key, (_, price) in _COST_TABLE.items()}
+
+
+@dataclass(frozen=True)
+class CostEstimate:
+    """Numeric cost figures for one generation, formatted only when to_dict() is called"""
+    model: str
+    size: str
+    quality: str
+    n: int
+    input_text_tokens: int
+    input_image_tokens: int
+    output_tokens: int
+    per_image_cost: Optional[float]  # Direct per-image price, None for unknown size/quality
+    input_text_cost: float
+    input_image_cost: float
+    output_cost: float
+    total_cost: float
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.input_text_tokens + self.input_image_tokens + self.output_tokens
+    
+    @property
+    def total_cents(self) -> int:
+        """Total cost in whole cents, as used in saved filenames"""
+        return int(self.total_cost * 100)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Cost figures with dollar amounts formatted for display"""
+        return {
+            "input_text_tokens": self.input_text_tokens,
+            "input_image_tokens": self.input_image_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.total_tokens,
+            "input_text_cost": f"${self.input_text_cost:.6f}",
+            "input_image_cost": f"${self.input_image_cost:.6f}" if self.input_image_tokens > 0 else "$0",
+            "output_cost": f"${self.output_cost:.6f}",
+            "total_cost": f"${self.total_cost:.6f}",
+            "total_cost_dollars": self.total_cost,
+            "total_cents": self.total_cents,
+            "cost_breakdown": {
+                "model": self.model,
+                "size": self.size,
+                "quality": self.quality,
+                "images": self.n,
+                "price_per_image": _PRICE_STR.get((self.size, self.quality), "$0.000") if self.model == "gpt-image-1" else "token-based"
+            }
+        }
+
+
+@functools.lru_cache(maxsize=512)
+def _calculate_cost(
+    size: str,
+    quality: str,
+    n: int,
+    input_text_tokens: int,
+    input_image_tokens: int,
+    model: str
+) -> CostEstimate:
+    """Cost figures for one argument combination, memoized (the result is immutable)"""
+    # Token-based pricing (per million tokens)
+    text_input_price = 5.00  # $5 per 1M tokens
+    image_input_price = 10.00  # $10 per 1M tokens
+    image_output_price = 40.00  # $40 per 1M tokens
+    
+    # One lookup for both figures; unknown combinations price like 1024x1024 medium
+    known = (size, quality) in _COST_TABLE
+    output_tokens, per_image_cost = _COST_TABLE.get((size, quality), (1056, 0.042))
+    total_output_tokens = output_tokens * n
+    
+    # Input costs (if using responses API with input)
+    input_text_cost = (input_text_tokens / 1_000_000) * text_input_price
+    input_image_cost = (input_image_tokens / 1_000_000) * image_input_price
+    
+    # Calculate costs
+    if model == "gpt-image-1":
+        # Use direct per-image pricing
+        output_cost = per_image_cost * n
+        total_cost = output_cost + input_text_cost + input_image_cost
+    else:
+        # Token-based calculation for other models
+        output_cost = (total_output_tokens / 1_000_000) * image_output_price
+        total_cost = input_text_cost + input_image_cost + output_cost
+    
+    return CostEstimate(
+        model=model,
+        size=size,
+        quality=quality,
+        n=n,
+        input_text_tokens=input_text_tokens,
+        input_image_tokens=input_image_tokens,
+        output_tokens=total_output_tokens,
+        per_image_cost=per_image_cost if known else None,
+        input_text_cost=input_text_cost,
+        input_image_cost=input_image_cost,
+        output_cost=output_cost,
+        total_cost=total_cost
+    )
+
+
+# Files above this size are encoded without caching; with 32 entries the cache
+# holds at most ~170 MB of base64 strings
+_ENCODE_CACHE_MAX_FILE_SIZE = 4 * 1024 * 1024
+
+
+@functools.lru_cache(maxsize=32)
+def _encode_file_cached(path: str, mtime_ns: int, size: int) -> str:
+    """Base64 encode a file; mtime and size are part of the key so edited files are re-read"""
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode('ascii')
+
+
+# Base64 prefixes of common image signatures, to label reference images without decoding them
+_B64_MIME_PREFIXES = (
+    ("iVBORw0KGgo", "image/png"),
+    ("/9j/", "image/jpeg"),
+    ("UklGR", "image/webp"),
+    ("R0lGOD", "image/gif"),
+)
+
+
+def _reference_data_url(ref_img: Dict[str, Any]) -> str:
+    """Data URI for a base64 reference image, passing through ones that already are"""
+    b64_data = ref_img["base64"]
+    if b64_data.startswith("data:"):
+        return b64_data
+    mime = ref_img.get("mime")
+    if mime is None:
+        mime = next(
+            (prefix_mime for prefix, prefix_mime in _B64_MIME_PREFIXES if b64_data.startswith(prefix)),
+            "image/jpeg"
+        )
+    return f"data:{mime};base64,{b64_data}"
+
+
+def _generation_succeeded(result: Dict[str, Any]) -> bool:
+    """Check a generation result holds every requested image, so partial failures are not cached"""
+    images = result.get("images")
+    if not result.get("success") or not images:
+        return False
+    if len(images) < result["metadata"].get("count", 1):
+        return False
+    return all(image.get("b64_json") for image in images)
+
+
+def _build_image_tool(**options) -> List[Dict[str, Any]]:
+    """Build the image_generation tool config, leaving out options that are not set"""
+    return [{"type": "image_generation", **{key: value for key, value in options.items() if value}}]
 
 
 class ImageGenerator:
     """Handles all image generation operations using OpenAI APIs"""
     
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
+    # Retries on rate limit / transient errors, with exponential backoff (SDK built-in)
+    DEFAULT_MAX_RETRIES = 5
+    
+    # Base64 characters decoded per write in save_image (multiple of 4)
+    B64_CHUNK_SIZE = 4 * 64 * 1024
+    
+    # Write buffer for saved/downloaded images, several decoded chunks per syscall
+    WRITE_BUFFER_SIZE = 1 << 20
+    
+    # Most images the images API returns for one request (its n limit)
+    MAX_IMAGES_PER_REQUEST = 10
+    
+    # Multi-turn results kept for get_serialized, by response ID
+    RESPONSE_CACHE_SIZE = 64
+    
+    # Size and quality options, as sets for membership checks
+    VALID_SIZES = frozenset({"1024x1024", "1536x1024", "1024x1536"})
+    VALID_QUALITIES = frozenset({"low", "medium", "high", "auto"})
+    
+    # Same options in display order
+    valid_sizes = ("1024x1024", "1536x1024", "1024x1536")
+    valid_qualities = ("low", "medium", "high", "auto")
+    
+    def __init__(
+        self,
+        api_key: str,
+        max_concurrency: Optional[int] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        cache_dir: Optional[Union[str, Path]] = None
+    ):
+        self.client = get_client(api_key, max_retries)
+        # Async client, created per event loop on first use (its connection pool is loop-bound)
+        self._api_key = api_key
+        self._max_retries = max_retries
+        self._async_client = None
+        self._async_client_loop = None
+        
+        # Optional on-disk cache of generation results (disabled unless a directory is set)
+        cache_dir = cache_dir or os.getenv("BGI_CACHE_DIR")
+        self.result_cache = ResultCache(cache_dir) if cache_dir else None
         
-        # Size options for images
-        self.valid_sizes = ["1024x1024", "1536x1024", "1024x1536"]
+        # Upper bound on concurrent async API calls, keeps batches within rate limits
+        self.max_concurrency = max_concurrency or int(os.getenv("BGI_CONCURRENCY", "4"))
+        self._semaphore = None
+        self._semaphore_loop = None
         
-        # Quality options
-        self.valid_qualities = ["low", "medium", "high", "auto"]
+        # Pooled HTTP sessions for image URL downloads, created on first use
+        self._http = None
+        self._ahttp = None
+        self._ahttp_loop = None
+        
+        # Recent multi-turn results, serialized on first get_serialized call
+        self._response_cache = OrderedDict()
+        self._response_cache_lock = threading.Lock()
 
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Get the concurrency semaphore for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+    
+    def _get_async_client(self) -> "AsyncOpenAI":
+        """Get the async API client for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = new_async_client(self._api_key, self._max_retries)
+            self._async_client_loop = loop
+        return self._async_client
+    
+    def _get_http(self):
+        """Get the requests session used for synchronous image downloads"""
+        if self._http is None:
+            import requests
+            self._http = requests.Session()
+        return self._http
+    
+    def _get_ahttp(self):
+        """Get the aiohttp session used for async image downloads on the running event loop"""
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        if self._ahttp is None or self._ahttp.closed or self._ahttp_loop is not loop:
+            self._ahttp = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300)
+            )
+            self._ahttp_loop = loop
+        return self._ahttp
+    
+    def close(self) -> None:
+        """Close the pooled synchronous HTTP session"""
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+    
+    async def aclose(self) -> None:
+        """Close all pooled HTTP sessions and the async API client"""
+        self.close()
+        if self._ahttp is not None:
+            await self._ahttp.close()
+            self._ahttp = None
+        if self._async_client is not None and self._async_client_loop is asyncio.get_running_loop():
+            await self._async_client.close()
+        self._async_client = None
+        self._async_client_loop = None
+    
+    def __enter__(self) -> "ImageGenerator":
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    async def __aenter__(self) -> "ImageGenerator":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
+    async def warm_up(self) -> bool:
+        """
+        Open the async client's connection ahead of the first generation
+        
+        Makes a cheap authenticated request so the TCP/TLS handshake can be
+        overlapped with other work such as prompt enhancement.
+        
+        Returns:
+            True if the API was reachable, False otherwise
+        """
+        try:
+            await self._get_async_client().models.list()
+            return True
+        except Exception:
+            return False
+    
+    @cached("generate_image", should_cache=_generation_succeeded)
     def generate_image(
         self,
         prompt: str,
@@ -63,7 +375,7 @@ class ImageGenerator:
                 result = self._generate_with_images_api(prompt, size, quality, n, background)
             else:
                 # Use responses API with GPT-5 or other models
-                result = self._generate_with_responses_api(prompt, size, quality, background, model)
+                result = self._generate_many_with_responses_api(prompt, size, quality, background, model, n)
             
             # Apply post-processing if requested
             if result["success"] and (compress_to_jpg or crop_to_16_9):
@@ -82,6 +394,146 @@ class ImageGenerator:
                 "error": str(e),
                 "metadata": {"prompt": prompt}
             }
+
+    @cached("generate_image", should_cache=_generation_succeeded)
+    async def generate_image_async(
+        self,
+        prompt: str,
+        size: Optional[str] = None,
+        quality: Optional[str] = None,
+        n: int = 1,
+        background: Optional[str] = None,
+        use_gpt_image: bool = False,
+        model: str = "gpt-5",
+        compress_to_jpg: bool = False,
+        crop_to_16_9: bool = False,
+        jpg_quality: int = 90
+    ) -> Dict[str, Any]:
+        """
+        Async version of generate_image
+        
+        Takes the same arguments and returns the same result dict. Generation is
+        network-bound, so several calls can be awaited together with
+        asyncio.gather to run them concurrently; at most max_concurrency
+        requests are in flight at once.
+        """
+        try:
+            if use_gpt_image:
+                async with self._get_semaphore():
+                    result = await self._generate_with_images_api_async(prompt, size, quality, n, background)
+            else:
+                result = await self._generate_many_with_responses_api_async(
+                    prompt, size, quality, background, model, n
+                )
+            
+            # Post-processing is CPU-bound, keep it off the event loop
+            if result["success"] and (compress_to_jpg or crop_to_16_9):
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(
+                    None,
+                    functools.partial(
+                        self._post_process_images,
+                        result,
+                        compress_to_jpg=compress_to_jpg,
+                        crop_to_16_9=crop_to_16_9,
+                        jpg_quality=jpg_quality
+                    )
+                )
+            
+            return result
+        
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "metadata": {"prompt": prompt}
+            }
+
+    async def generate_images_async(self, prompts: List[str], **kwargs) -> List[Dict[str, Any]]:
+        """
+        Generate images for several prompts in as few API calls as possible
+        
+        With the images API (use_gpt_image=True), repeated prompts are packed
+        into shared requests using n (up to MAX_IMAGES_PER_REQUEST images each);
+        all requests run concurrently.
+        
+        Args:
+            prompts: Prompts to generate, duplicates allowed
+            **kwargs: Any other generate_image_async argument (n is per prompt)
+        
+        Returns:
+            One result dict per prompt, in the same order as prompts
+        """
+        if not kwargs.get("use_gpt_image"):
+            return list(await asyncio.gather(
+                *(self.generate_image_async(prompt, **kwargs) for prompt in prompts)
+            ))
+        
+        n = kwargs.pop("n", 1)
+        # Repeats of a prompt share requests of at most MAX_IMAGES_PER_REQUEST images,
+        # each occurrence recording its (request, offset) slot
+        per_request = max(1, self.MAX_IMAGES_PER_REQUEST // n)
+        batches = []  # [prompt, occurrences, first batch of the prompt]
+        slots = []
+        open_request = {}
+        for prompt in prompts:
+            index = open_request.get(prompt)
+            if index is None or batches[index][1] == per_request:
+                batches.append([prompt, 0, index is None])
+                index = open_request[prompt] = len(batches) - 1
+            slots.append((index, batches[index][1] * n))
+            batches[index][1] += 1
+        
+        # Later batches of a prompt can match an earlier one exactly, they skip the result
+        # cache so they are not coalesced into (or served from) the same images
+        generate_uncached = functools.partial(type(self).generate_image_async.__wrapped__, self)
+        batched = await asyncio.gather(*(
+            (self.generate_image_async if is_first else generate_uncached)(prompt, n=n * count, **kwargs)
+            for prompt, count, is_first in batches
+        ))
+        
+        # Hand each occurrence of a prompt its own result, with its slice of the batched images
+        results = []
+        for index, start in slots:
+            result = batched[index]
+            if not result["success"]:
+                results.append({**result, "metadata": dict(result["metadata"])})
+                continue
+            
+            results.append({
+                **result,
+                "images": result["images"][start:start + n],
+                "metadata": {**result["metadata"], "count": n}
+            })
+        
+        return results
+    
+    async def iter_generate_async(
+        self,
+        prompts: List[str],
+        **kwargs
+    ) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+        """
+        Generate images for several prompts, yielding each result as soon as it is ready
+        
+        Args:
+            prompts: Prompts to generate
+            **kwargs: Any other generate_image_async argument
+        
+        Yields:
+            Tuples of (index into prompts, result dict) in completion order
+        """
+        async def indexed(index: int, prompt: str) -> Tuple[int, Dict[str, Any]]:
+            return index, await self.generate_image_async(prompt, **kwargs)
+        
+        tasks = [asyncio.ensure_future(indexed(i, prompt)) for i, prompt in enumerate(prompts)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Stop outstanding requests if the consumer breaks out early
+            for task in tasks:
+                task.cancel()
     
     def _generate_with_responses_api(
         self,
@@ -92,25 +544,111 @@ class ImageGenerator:
         model: str = "gpt-5"
     ) -> Dict[str, Any]:
         """Generate image using the responses API"""
-        # Build tools configuration
-        tools_config = [{"type": "image_generation"}]
-        
-        # Add optional parameters to the tool config
-        if quality:
-            tools_config[0]["quality"] = quality
-        if size:
-            tools_config[0]["size"] = size
-        if background:
-            tools_config[0]["background"] = background
-        
-        # Make API call
         response = self.client.responses.create(
-            model=model,
-            input=prompt,
-            tools=tools_config
+            **self._responses_request(prompt, size, quality, background, model)
         )
+        return self._responses_result(response, prompt, size, quality, model)
+    
+    async def _generate_with_responses_api_async(
+        self,
+        prompt: str,
+        size: Optional[str] = None,
+        quality: Optional[str] = None,
+        background: Optional[str] = None,
+        model: str = "gpt-5"
+    ) -> Dict[str, Any]:
+        """Generate image using the responses API without blocking the event loop"""
+        response = await self._get_async_client().responses.create(
+            **self._responses_request(prompt, size, quality, background, model)
+        )
+        return self._responses_result(response, prompt, size, quality, model)
+    
+    def _generate_many_with_responses_api(
+        self,
+        prompt: str,
+        size: Optional[str],
+        quality: Optional[str],
+        background: Optional[str],
+        model: str,
+        n: int
+    ) -> Dict[str, Any]:
+        """
+        Generate n images with the responses API as n parallel requests
+        
+        Same as _generate_many_with_responses_api_async, with at most
+        max_concurrency requests running in worker threads.
+        """
+        if n <= 1:
+            return self._generate_with_responses_api(prompt, size, quality, background, model)
+        
+        with ThreadPoolExecutor(max_workers=min(n, self.max_concurrency)) as executor:
+            results = list(executor.map(
+                lambda _: self._generate_with_responses_api(prompt, size, quality, background, model),
+                range(n)
+            ))
+        return self._merge_responses_results(results, n)
+    
+    async def _generate_many_with_responses_api_async(
+        self,
+        prompt: str,
+        size: Optional[str],
+        quality: Optional[str],
+        background: Optional[str],
+        model: str,
+        n: int
+    ) -> Dict[str, Any]:
+        """
+        Generate n images with the responses API as n concurrent requests
+        
+        Each responses call returns a single image, so the requests are issued
+        together (each holding its own concurrency slot) and merged into one result.
+        """
+        async def generate_one() -> Dict[str, Any]:
+            async with self._get_semaphore():
+                return await self._generate_with_responses_api_async(prompt, size, quality, background, model)
         
-        # Process response
+        if n <= 1:
+            return await generate_one()
+        
+        results = await asyncio.gather(*(generate_one() for _ in range(n)))
+        return self._merge_responses_results(results, n)
+    
+    @staticmethod
+    def _merge_responses_results(results: List[Dict[str, Any]], n: int) -> Dict[str, Any]:
+        """Merge single-image responses results into one result of n images"""
+        images = [image for result in results for image in result["images"]]
+        for i, image in enumerate(images):
+            image["image_id"] = f"img_{i}"
+        
+        result = results[0]
+        result["images"] = images
+        result["metadata"]["count"] = n
+        return result
+    
+    def _responses_request(
+        self,
+        prompt: str,
+        size: Optional[str],
+        quality: Optional[str],
+        background: Optional[str],
+        model: str
+    ) -> Dict[str, Any]:
+        """Build the responses API request arguments"""
+        return {
+            "model": model,
+            "input": prompt,
+            "tools": _build_image_tool(quality=quality, size=size, background=background)
+        }
+    
+    def _responses_result(
+        self,
+        response: Any,
+        prompt: str,
+        size: Optional[str],
+        quality: Optional[str],
+        model: str
+    ) -> Dict[str, Any]:
+        """Convert a responses API response into a result dict"""
         result = {
             "success": True,
             "images": [],
@@ -124,20 +662,21 @@ class ImageGenerator:
         }
         
         # Extract images from response - matching reference code structure
-        if hasattr(response, 'output') and response.output:
-            image_data = [
-                output.result
-                for output in response.output
-                if hasattr(output, 'type') and output.type == "image_generation_call"
-            ]
-            
-            for i, b64_data in enumerate(image_data):
-                if b64_data:
-                    result["images"].append({
-                        "b64_json": b64_data,
-                        "revised_prompt": None,  # May not be available in responses API
-                        "image_id": f"img_{i}"
-                    })
+        try:
+            outputs = response.output or []
+        except AttributeError:
+            outputs = []
+        image_data = [output.result for output in outputs if output.type == "image_generation_call"]
+        
+        result["images"] = [
+            {
+                "b64_json": b64_data,
+                "revised_prompt": None,  # May not be available in responses API
+                "image_id": f"img_{i}"
+            }
+            for i, b64_data in enumerate(image_data)
+            if b64_data
+        ]
         
         return result
     
@@ -150,28 +689,112 @@ class ImageGenerator:
         background: Optional[str] = None
     ) -> Dict[str, Any]:
         """Generate image using the direct images API with gpt-image-1"""
-        # Build parameters
-        params = {
-            "model": "gpt-image-1",
-            "prompt": prompt
-        }
+        response = self.client.images.generate(
+            **self._images_request(prompt, size, quality, n, background)
+        )
         
-        # Add optional parameters
-        if size:
-            params["size"] = size
-        if quality:
-            params["quality"] = quality
-        if n:
-            params["n"] = n
+        # Fetch several URL-only images in parallel rather than one after another
+        urls = self._url_only_images(response)
+        downloads = self._download_images(urls) if len(urls) > 1 else None
+        return self._images_result(response, prompt, size, quality, n, downloads)
+    
+    async def _generate_with_images_api_async(
+        self,
+        prompt: str,
+        size: Optional[str] = None,
+        quality: Optional[str] = None,
+        n: int = 1,
+        background: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Generate image using the images API without blocking the event loop"""
+        response = await self._get_async_client().images.generate(
+            **self._images_request(prompt, size, quality, n, background)
+        )
         
-        # Add background parameter if specified
-        if background:
-            params["background"] = background
+        # Fetch any URL-only images concurrently instead of one after another
+        urls = self._url_only_images(response)
+        downloads = await self._download_images_async(urls) if urls else None
+        return self._images_result(response, prompt, size, quality, n, downloads)
+    
+    def _url_only_images(self, response: Any) -> List[str]:
+        """URLs of the images in an images API response that came without b64_json"""
+        return [
+            image_data.url for image_data in response.data
+            if image_data.b64_json is None and image_data.url is not None
+        ]
+    
+    def _download_images(self, urls: List[str]) -> Dict[str, Any]:
+        """
+        Download several image URLs in parallel worker threads
+        
+        Returns:
+            Same mapping as _download_images_async
+        """
+        session = self._get_http()
+        
+        def fetch(url: str) -> Any:
+            try:
+                response = session.get(url, timeout=30)
+                return response.content if response.status_code == 200 else None
+            except Exception as e:
+                return e
         
-        # Make API call
-        response = self.client.images.generate(**params)
+        with ThreadPoolExecutor(max_workers=min(8, len(urls))) as executor:
+            return dict(zip(urls, executor.map(fetch, urls)))
+    
+    async def _download_images_async(self, urls: List[str]) -> Dict[str, Any]:
+        """
+        Download several image URLs concurrently
+        
+        Returns:
+            Dict mapping each URL to its bytes, None for a non-200 response,
+            or the exception raised while fetching it
+        """
+        session = self._get_ahttp()
         
-        # Process response
+        async def fetch(url: str) -> Optional[bytes]:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    return None
+                return await response.read()
+        
+        contents = await asyncio.gather(*(fetch(url) for url in urls), return_exceptions=True)
+        return dict(zip(urls, contents))
+    
+    def _images_request(
+        self,
+        prompt: str,
+        size: Optional[str],
+        quality: Optional[str],
+        n: int,
+        background: Optional[str]
+    ) -> Dict[str, Any]:
+        """Build the images API request arguments"""
+        optional = {"size": size, "quality": quality, "n": n, "background": background}
+        
+        # Single merge, unset optional parameters are left out
+        return {
+            "model": "gpt-image-1",
+            "prompt": prompt,
+            **{key: value for key, value in optional.items() if value}
+        }
+    
+    def _images_result(
+        self,
+        response: Any,
+        prompt: str,
+        size: Optional[str],
+        quality: Optional[str],
+        n: int,
+        downloads: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Convert an images API response into a result dict
+        
+        Args:
+            downloads: Pre-fetched URL contents from _download_images_async;
+                URLs missing here are fetched synchronously
+        """
         result = {
             "success": True,
             "images": [],
@@ -188,21 +811,26 @@ class ImageGenerator:
         # Process images from response
         for image_data in response.data:
             # Check if response has b64_json or url
-            if hasattr(image_data, 'b64_json'):
+            if image_data.b64_json is not None:
                 result["images"].append({
                     "b64_json": image_data.b64_json,
-                    "revised_prompt": getattr(image_data, 'revised_prompt', None)
+                    "revised_prompt": image_data.revised_prompt
                 })
-            elif hasattr(image_data, 'url'):
+            elif image_data.url is not None:
                 # If URL is returned, we can fetch and convert to base64
-                import requests
                 try:
-                    img_response = requests.get(image_data.url)
-                    if img_response.status_code == 200:
-                        b64_data = base64.b64encode(img_response.content).decode('utf-8')
+                    if downloads is not None and image_data.url in downloads:
+                        content = downloads[image_data.url]
+                        if isinstance(content, Exception):
+                            raise content
+                    else:
+                        img_response = self._get_http().get(image_data.url, timeout=30)
+                        content = img_response.content if img_response.status_code == 200 else None
+                    if content is not None:
+                        b64_data = base64.b64encode(content).decode('ascii')
                         result["images"].append({
                             "b64_json": b64_data,
-                            "revised_prompt": getattr(image_data, 'revised_prompt', None),
+                            "revised_prompt": image_data.revised_prompt,
                             "url": image_data.url
                         })
                 except Exception as e:
@@ -227,7 +855,8 @@ class ImageGenerator:
         
         Args:
             prompt: Description of the desired edit
-            reference_images: List of reference images as dicts with type and data
+            reference_images: List of reference images as dicts with one of base64
+                (raw or a data URI, optional mime), file_id or url
             mask: Optional mask configuration
             quality: Output quality
             input_fidelity: How closely to preserve input details (low/high)
@@ -245,7 +874,7 @@ class ImageGenerator:
                 if "base64" in ref_img:
                     content.append({
                         "type": "input_image",
-                        "image_url": f"data:image/jpeg;base64,{ref_img['base64']}"
+                        "image_url": _reference_data_url(ref_img)
                     })
                 elif "file_id" in ref_img:
                     content.append({
@@ -259,14 +888,11 @@ class ImageGenerator:
                     })
             
             # Build tools configuration
-            tools_config = [{"type": "image_generation"}]
-            
-            if quality:
-                tools_config[0]["quality"] = quality
-            if input_fidelity:
-                tools_config[0]["input_fidelity"] = input_fidelity
-            if mask:
-                tools_config[0]["input_image_mask"] = mask
+            tools_config = _build_image_tool(
+                quality=quality,
+                input_fidelity=input_fidelity,
+                input_image_mask=mask
+            )
             
             # Make API call
             response = self.client.responses.create(
@@ -291,14 +917,17 @@ class ImageGenerator:
                 }
             }
             
-            # Extract images
-            for output in response.output:
-                if output.type == "image_generation_call":
-                    result["images"].append({
-                        "b64_json": output.result,
-                        "revised_prompt": getattr(output, 'revised_prompt', None),
-                        "image_id": getattr(output, 'id', None)
-                    })
+            # Extract images (revised_prompt is only a field on newer SDK versions, check it once)
+            image_calls = [output for output in response.output if output.type == "image_generation_call"]
+            has_revised_prompt = bool(image_calls) and "revised_prompt" in type(image_calls[0]).model_fields
+            result["images"] = [
+                {
+                    "b64_json": output.result,
+                    "revised_prompt": output.revised_prompt if has_revised_prompt else None,
+                    "image_id": output.id
+                }
+                for output in image_calls
+            ]
             
             return result
             
@@ -314,6 +943,7 @@ class ImageGenerator:
         prompt: str,
         partial_images: int = 2,
         model: str = "gpt-image-1",
+        stop_after_final: bool = True,
         **kwargs
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """
@@ -323,14 +953,19 @@ class ImageGenerator:
             prompt: Text description
             partial_images: Number of partial images (0-3)
             model: Model to use
+            stop_after_final: Close the stream once all n final images arrived,
+                instead of waiting for trailing events
             **kwargs: Additional parameters
             
         Yields:
             Dict containing partial or final images
         """
+        stream = None
+        expected_finals = kwargs.get("n") or 1
+        finals = 0
         try:
             # Use the images.generate API with streaming
-            stream = await self.async_client.images.generate(
+            stream = await self._get_async_client().images.generate(
                 model=model,
                 prompt=prompt,
                 stream=True,
@@ -345,21 +980,39 @@ class ImageGenerator:
                         "index": event.partial_image_index,
                         "b64_json": event.b64_json
                     }
-                elif hasattr(event, 'data'):
+                    continue
+                
+                if event.type == "image_generation.completed":
                     # Final image
+                    finals += 1
+                    yield {
+                        "type": "complete",
+                        "b64_json": event.b64_json,
+                        "revised_prompt": None
+                    }
+                elif hasattr(event, 'data'):
+                    # Final image (non-event response shape)
                     for image_data in event.data:
-                        if hasattr(image_data, 'b64_json'):
+                        if image_data.b64_json is not None:
+                            finals += 1
                             yield {
                                 "type": "complete",
                                 "b64_json": image_data.b64_json,
-                                "revised_prompt": getattr(image_data, 'revised_prompt', None)
+                                "revised_prompt": image_data.revised_prompt
                             }
+                
+                if stop_after_final and finals >= expected_finals:
+                    break
                             
         except Exception as e:
             yield {
                 "type": "error",
                 "error": str(e)
             }
+        finally:
+            # Also runs when the consumer stops early, so the connection goes back to the pool
+            if stream is not None:
+                await stream.close()
 
     def multi_turn_generation(
         self,
@@ -382,9 +1035,7 @@ class ImageGenerator:
         """
         try:
             # Build tools configuration
-            tools_config = [{"type": "image_generation"}]
-            if quality:
-                tools_config[0]["quality"] = quality
+            tools_config = _build_image_tool(quality=quality)
             
             # Make API call with previous response reference
             response = self.client.responses.create(
@@ -406,15 +1057,19 @@ class ImageGenerator:
                 }
             }
             
-            # Extract images
-            for output in response.output:
-                if output.type == "image_generation_call":
-                    result["images"].append({
-                        "b64_json": output.result,
-                        "revised_prompt": getattr(output, 'revised_prompt', None),
-                        "image_id": getattr(output, 'id', None)
-                    })
+            # Extract images (revised_prompt is only a field on newer SDK versions, check it once)
+            image_calls = [output for output in response.output if output.type == "image_generation_call"]
+            has_revised_prompt = bool(image_calls) and "revised_prompt" in type(image_calls[0]).model_fields
+            result["images"] = [
+                {
+                    "b64_json": output.result,
+                    "revised_prompt": output.revised_prompt if has_revised_prompt else None,
+                    "image_id": output.id
+                }
+                for output in image_calls
+            ]
             
+            self._remember_response(response.id, result)
             return result
             
         except Exception as e:
@@ -423,6 +1078,36 @@ class ImageGenerator:
                 "error": str(e),
                 "metadata": {"prompt": new_prompt}
             }
+    
+    def _remember_response(self, response_id: str, result: Dict[str, Any]) -> None:
+        """Keep a result for get_serialized, dropping the least recently used past RESPONSE_CACHE_SIZE"""
+        with self._response_cache_lock:
+            self._response_cache[response_id] = result
+            self._response_cache.move_to_end(response_id)
+            if len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+    
+    def get_serialized(self, response_id: str) -> Optional[bytes]:
+        """
+        JSON bytes of a recent multi_turn_generation result
+        
+        The result is serialized on the first call and the bytes are reused after
+        that, so returning the same turn to clients and logs encodes it only once.
+        
+        Args:
+            response_id: The result's response_id
+        
+        Returns:
+            Serialized result, or None if it is not (or no longer) cached
+        """
+        with self._response_cache_lock:
+            if response_id not in self._response_cache:
+                return None
+            self._response_cache.move_to_end(response_id)
+            value = self._response_cache[response_id]
+            if not isinstance(value, bytes):
+                value = self._response_cache[response_id] = self.dumps(value)
+            return value
 
     def _post_process_images(
         self,
@@ -443,6 +1128,8 @@ class ImageGenerator:
         Returns:
             Updated result dictionary with processed images
         """
+        from PIL import Image
+        
         processed_images = []
         
         for img_data in result.get("images", []):
@@ -478,8 +1165,7 @@ class ImageGenerator:
                     format_used = "png"
                 
                 # Encode back to base64
-                output_buffer.seek(0)
-                processed_b64 = base64.b64encode(output_buffer.read()).decode('utf-8')
+                processed_b64 = base64.b64encode(output_buffer.getvalue()).decode('ascii')
                 
                 # Update image data
                 processed_img = img_data.copy()
@@ -499,7 +1185,7 @@ class ImageGenerator:
                 processed_images.append(processed_img)
                 
             except Exception as e:
-                print(f"Warning: Failed to process image: {e}")
+                logger.warning("Failed to process image: %s", e)
                 # Keep original image if processing fails
                 processed_images.append(img_data)
         
@@ -515,7 +1201,7 @@ class ImageGenerator:
         
         return result
     
-    def _crop_to_aspect_ratio(self, img: Image.Image, aspect_ratio: tuple = None) -> Image.Image:
+    def _crop_to_aspect_ratio(self, img: "Image.Image", aspect_ratio: tuple = None) -> "Image.Image":
         """
         Crop image to specified aspect ratio
         Auto-detects orientation: landscape -> 16:9, portrait -> 9:16
@@ -569,30 +1255,99 @@ class ImageGenerator:
         
         cropped = img.crop((left, top, right, bottom))
         
-        # Log the crop info
-        final_ratio = cropped.width / cropped.height
-        if detected_orientation == "landscape":
-            print(f"   Cropped to 16:9 landscape: {cropped.width}x{cropped.height}")
-        elif detected_orientation == "portrait":
-            print(f"   Cropped to 9:16 portrait: {cropped.width}x{cropped.height}")
+        # Log the crop info (skipped entirely when INFO is disabled)
+        if detected_orientation != "custom" and logger.isEnabledFor(logging.INFO):
+            label = "16:9 landscape" if detected_orientation == "landscape" else "9:16 portrait"
+            logger.info("   Cropped to %s: %dx%d", label, cropped.width, cropped.height)
         
         return cropped
 
     def save_image(self, b64_json: str, filepath: Union[str, Path]) -> bool:
         """Save a base64 encoded image to file"""
+        tmp_path = None
         try:
-            image_data = base64.b64decode(b64_json)
-            with open(filepath, "wb") as f:
-                f.write(image_data)
+            # Fixed-size chunks decode on their own once all whitespace is gone (API payloads
+            # have none, so nothing is copied), and the full decoded image never has to sit
+            # in memory at once
+            b64_json = "".join(b64_json.split())
+            chunks = (
+                base64.b64decode(b64_json[start:start + self.B64_CHUNK_SIZE])
+                for start in range(0, len(b64_json), self.B64_CHUNK_SIZE)
+            )
+            # Decoding is lazy, so write to a temp file and only move it into place once
+            # the whole payload decoded (a bad one leaves no truncated file behind)
+            filepath = Path(filepath)
+            tmp_path = filepath.with_name(f".{filepath.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "wb", buffering=self.WRITE_BUFFER_SIZE) as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp_path, filepath)
             return True
         except Exception as e:
-            print(f"Error saving image: {e}")
+            logger.error("Error saving image: %s", e)
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
             return False
 
+    def save_images(self, images: List[Tuple[str, Union[str, Path]]]) -> List[bool]:
+        """
+        Save several base64 encoded images in parallel
+        
+        Args:
+            images: (b64_json, filepath) pairs
+        
+        Returns:
+            Success flag for each image, in the same order
+        """
+        if len(images) <= 1:
+            return [self.save_image(b64_json, filepath) for b64_json, filepath in images]
+        with ThreadPoolExecutor(max_workers=min(8, len(images))) as executor:
+            return list(executor.map(lambda image: self.save_image(*image), images))
+    
+    def download_image(self, url: str, filepath: Union[str, Path]) -> bool:
+        """Stream an image URL straight to file without holding it in memory"""
+        try:
+            with self._get_http().get(url, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                with open(filepath, "wb", buffering=self.WRITE_BUFFER_SIZE) as f:
+                    shutil.copyfileobj(response.raw, f, 64 * 1024)
+            return True
+        except Exception as e:
+            logger.error("Error downloading image: %s", e)
+            return False
+    
+    async def download_image_async(self, url: str, filepath: Union[str, Path]) -> bool:
+        """Async version of download_image, writing the image in one worker thread call"""
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._get_ahttp().get(url) as response:
+                response.raise_for_status()
+                content = await response.read()
+            # One thread hop for the whole file rather than one per received chunk
+            await loop.run_in_executor(None, Path(filepath).write_bytes, content)
+            return True
+        except Exception as e:
+            logger.error("Error downloading image: %s", e)
+            return False
+    
     def image_to_base64(self, image_path: Union[str, Path]) -> str:
-        """Convert an image file to base64 string"""
-        with open(image_path, "rb") as f:
-            return base64.b64encode(f.read()).decode('utf-8')
+        """Convert an image file to base64 string (recently used files are cached)"""
+        stat = os.stat(image_path)
+        if stat.st_size > _ENCODE_CACHE_MAX_FILE_SIZE:
+            with open(image_path, "rb") as f:
+                return base64.b64encode(f.read()).decode('ascii')
+        return _encode_file_cached(os.fspath(image_path), stat.st_mtime_ns, stat.st_size)
+    
+    def images_to_base64(self, image_paths: List[Union[str, Path]]) -> List[str]:
+        """Convert several image files to base64 strings in parallel, keeping their order"""
+        if len(image_paths) <= 1:
+            return [self.image_to_base64(path) for path in image_paths]
+        with ThreadPoolExecutor(max_workers=min(8, len(image_paths))) as executor:
+            return list(executor.map(self.image_to_base64, image_paths))
 
     def calculate_cost(
         self,
@@ -609,78 +1364,30 @@ class ImageGenerator:
         Returns:
             Dict with token counts, costs, and price in cents
         """
-        # Token counts for output based on documentation
-        token_counts = {
-            ("1024x1024", "low"): 272,
-            ("1024x1024", "medium"): 1056,
-            ("1024x1024", "high"): 4160,
-            ("1024x1536", "low"): 408,
-            ("1024x1536", "medium"): 1584,
-            ("1024x1536", "high"): 6240,
-            ("1536x1024", "low"): 400,
-            ("1536x1024", "medium"): 1568,
-            ("1536x1024", "high"): 6208,
-        }
-        
-        # Direct per-image pricing for gpt-image-1 (in dollars)
-        image_pricing = {
-            ("1024x1024", "low"): 0.011,
-            ("1024x1024", "medium"): 0.042,
-            ("1024x1024", "high"): 0.167,
-            ("1024x1536", "low"): 0.016,
-            ("1024x1536", "medium"): 0.063,
-            ("1024x1536", "high"): 0.250,
-            ("1536x1024", "low"): 0.016,
-            ("1536x1024", "medium"): 0.063,
-            ("1536x1024", "high"): 0.250,
-        }
-        
-        # Token-based pricing (per million tokens)
-        text_input_price = 5.00  # $5 per 1M tokens
-        image_input_price = 10.00  # $10 per 1M tokens
-        image_output_price = 40.00  # $40 per 1M tokens
-        
-        output_tokens = token_counts.get((size, quality), 1056)
-        total_output_tokens = output_tokens * n
-        
-        # Calculate costs
-        if model == "gpt-image-1":
-            # Use direct per-image pricing
-            per_image_cost = image_pricing.get((size, quality), 0.042)
-            total_image_cost = per_image_cost * n
-            
-            # Add input costs (if using responses API with input)
-            input_text_cost = (input_text_tokens / 1_000_000) * text_input_price
-            input_image_cost = (input_image_tokens / 1_000_000) * image_input_price
-            
-            total_cost = total_image_cost + input_text_cost + input_image_cost
-        else:
-            # Token-based calculation for other models
-            input_text_cost = (input_text_tokens / 1_000_000) * text_input_price
-            input_image_cost = (input_image_tokens / 1_000_000) * image_input_price
-            output_cost = (total_output_tokens / 1_000_000) * image_output_price
-            
-            total_cost = input_text_cost + input_image_cost + output_cost
-        
-        # Convert to cents for filename
-        total_cents = int(total_cost * 100)
+        return self.cost_estimate(size, quality, n, input_text_tokens, input_image_tokens, model).to_dict()
+    
+    def cost_estimate(
+        self,
+        size: str = "1024x1024",
+        quality: str = "medium",
+        n: int = 1,
+        input_text_tokens: int = 50,
+        input_image_tokens: int = 0,
+        model: str = "gpt-image-1"
+    ) -> CostEstimate:
+        """Same as calculate_cost but returns the unformatted figures (e.g. total_cents for filenames)"""
+        return _calculate_cost(size, quality, n, input_text_tokens, input_image_tokens, model)
+    
+    def estimate_cost(self, size: str = "1024x1024", quality: str = "medium", n: int = 1) -> Dict[str, Any]:
+        """Estimate the cost of generating n images with gpt-image-1 from a short text prompt"""
+        return self.calculate_cost(size=size, quality=quality, n=n)
+    
+    @staticmethod
+    def dumps(result: Dict[str, Any]) -> bytes:
+        """
+        Serialize a result or cost dict to JSON bytes (uses orjson when installed)
         
-        return {
-            "input_text_tokens": input_text_tokens,
-            "input_image_tokens": input_image_tokens,
-            "output_tokens": total_output_tokens,
-            "total_tokens": input_text_tokens + input_image_tokens + total_output_tokens,
-            "input_text_cost": f"${input_text_cost:.6f}",
-            "input_image_cost": f"${input_image_cost:.6f}" if input_image_tokens > 0 else "$0",
-            "output_cost": f"${total_image_cost if model == 'gpt-image-1' else (total_output_tokens / 1_000_000) * image_output_price:.6f}",
-            "total_cost": f"${total_cost:.6f}",
-            "total_cost_dollars": total_cost,
-            "total_cents": total_cents,
-            "cost_breakdown": {
-                "model": model,
-                "size": size,
-                "quality": quality,
-                "images": n,
-                "price_per_image": f"${image_pricing.get((size, quality), 0):.3f}" if model == "gpt-image-1" else "token-based"
-            }
-        }
\ No newline at end of file
+        Results carry multi-MB base64 images, so web integrations returning them
+        as JSON responses should use this rather than json.dumps.
+        """
+        return encode_json(result)
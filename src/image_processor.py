@@ -4,16 +4,94 @@ Handles image preprocessing, mask creation, and optimization
 """
 
 import base64
+import functools
 import io
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Tuple, Union, List
-from PIL import Image, ImageOps, ImageFilter
+from PIL import Image, ImageDraw, ImageOps, ImageFilter, features
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+# numba is optional, it fuses the white-pixel check and write of optimize_for_transparency
+# into one parallel pass without temporary arrays (the NumPy path is used otherwise)
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Transparent white RGBA pixel as one native 32-bit word
+_TRANSPARENT_WHITE = np.array([255, 255, 255, 0], dtype=np.uint8).view(np.uint32)[0]
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _make_white_transparent(data, threshold):
+        """Set near-white pixels of an RGBA array to transparent white, in place"""
+        for i in prange(data.shape[0]):
+            for j in range(data.shape[1]):
+                if data[i, j, 0] > threshold and data[i, j, 1] > threshold and data[i, j, 2] > threshold:
+                    data[i, j, 0] = 255
+                    data[i, j, 1] = 255
+                    data[i, j, 2] = 255
+                    data[i, j, 3] = 0
+
+
+# Matches any "scheme://" prefix so URL references can be told apart from file paths
+_URL_RE = re.compile(r'^([a-z][a-z0-9+\-.]*)://', re.I)
+
+
+def _fetch_http(url: str) -> bytes:
+    """Download an image over HTTP(S)"""
+    import requests
+    response = requests.get(url, timeout=60)
+    response.raise_for_status()
+    return response.content
+
+
+# URL scheme -> fetcher returning the image bytes
+_URL_FETCHERS = {
+    "http": _fetch_http,
+    "https": _fetch_http,
+}
+
+
+def _freeze(value):
+    """Hashable copy of mask parameters (dicts and lists of coordinates become tuples)"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@functools.lru_cache(maxsize=None)
+def _check_jpeg_backend() -> bool:
+    """Warn once if Pillow's JPEG codec is not libjpeg-turbo (several times slower to encode/decode)"""
+    turbo = bool(features.check_feature("libjpeg_turbo"))
+    if not turbo:
+        logger.warning(
+            "Pillow is not linked against libjpeg-turbo, JPEG encode/decode will be slow. "
+            "Install pillow-simd or a libjpeg-turbo based Pillow build for a large speed-up."
+        )
+    return turbo
+
 
 class ImageProcessor:
     """Handles image preprocessing and optimization"""
     
+    # Output formats whose size depends on the quality setting
+    QUALITY_FORMATS = frozenset({"JPEG", "WEBP"})
+    
+    # Encoded masks kept by create_mask, by dimensions and parameters
+    MASK_CACHE_SIZE = 32
+    
     def __init__(self):
         # Supported formats
         self.supported_formats = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}
@@ -22,32 +100,60 @@ class ImageProcessor:
         self.max_file_size = 50 * 1024 * 1024  # 50MB
         self.valid_dimensions = [(1024, 1024), (1536, 1024), (1024, 1536)]
         
+        self._mask_cache = OrderedDict()
+        self._mask_cache_lock = threading.Lock()
+        
+        _check_jpeg_backend()
+    
+    def _load_image(self, image: Union[str, Path, bytes, Image.Image]) -> Image.Image:
+        """Open an image given as a PIL Image, raw bytes, file path or URL"""
+        if isinstance(image, Image.Image):
+            return image
+        if isinstance(image, bytes):
+            return Image.open(io.BytesIO(image))
+        
+        match = _URL_RE.match(image) if isinstance(image, str) else None
+        if match:
+            fetcher = _URL_FETCHERS.get(match.group(1).lower())
+            if fetcher is None:
+                raise ValueError(f"Unsupported image URL scheme: {match.group(1)}")
+            return Image.open(io.BytesIO(fetcher(image)))
+        
+        return Image.open(image)
+    
     def prepare_input_image(
         self,
         image_path: Union[str, Path, bytes, Image.Image],
         target_size: Optional[Tuple[int, int]] = None,
         maintain_aspect_ratio: bool = True,
-        format: str = "PNG"
+        format: str = "PNG",
+        resample: Optional[Image.Resampling] = None
     ) -> bytes:
         """
         Prepare an image for API input
         
         Args:
-            image_path: Input image (path, bytes, or PIL Image)
+            image_path: Input image (path, URL, bytes, or PIL Image)
             target_size: Target dimensions (width, height)
             maintain_aspect_ratio: Whether to maintain aspect ratio
             format: Output format (PNG, JPEG, WEBP)
+            resample: Resampling filter (default: BICUBIC for target_size, BILINEAR
+                for the automatic resize to a valid dimension; LANCZOS for best quality)
             
         Returns:
             Processed image as bytes
         """
-        # Load image
-        if isinstance(image_path, Image.Image):
-            img = image_path
-        elif isinstance(image_path, bytes):
-            img = Image.open(io.BytesIO(image_path))
-        else:
-            img = Image.open(image_path)
+        # Load image (header only, pixels are decoded on first access)
+        img = self._load_image(image_path)
+        
+        # Inputs already in the requested format and a valid size are returned as they are
+        passthrough = self._passthrough_bytes(image_path, img, target_size, format)
+        if passthrough is not None:
+            return passthrough
+        
+        # Large JPEGs that are going to be downsized can be decoded at reduced scale
+        if img.format == "JPEG":
+            self._draft_for_size(img, target_size or self._nearest_valid_size(img.size))
         
         # Convert RGBA to RGB if saving as JPEG
         if format.upper() == "JPEG" and img.mode in ("RGBA", "LA", "P"):
@@ -55,38 +161,80 @@ class ImageProcessor:
             background = Image.new("RGB", img.size, (255, 255, 255))
             if img.mode == "P":
                 img = img.convert("RGBA")
-            background.paste(img, mask=img.split()[-1] if img.mode == "RGBA" else None)
+            # An RGBA/LA image used as its own mask composites with its alpha band directly,
+            # without split() copying out every band first
+            background.paste(img, mask=img)
             img = background
         
         # Resize if needed
         if target_size:
-            img = self._resize_image(img, target_size, maintain_aspect_ratio)
+            img = self._resize_image(img, target_size, maintain_aspect_ratio, resample or Image.Resampling.BICUBIC)
         else:
             # Auto-resize to nearest valid dimension if too large
-            img = self._auto_resize_to_valid(img)
+            img = self._auto_resize_to_valid(img, resample or Image.Resampling.BILINEAR)
         
-        # Convert to bytes
+        # Convert to bytes, picking the quality up front so large images are encoded once
+        quality = self._pick_quality(img, format)
         buffer = io.BytesIO()
-        img.save(buffer, format=format, optimize=True, quality=95)
+        img.save(buffer, format=format, optimize=True, quality=quality)
         
         # Check file size
-        if buffer.tell() > self.max_file_size:
+        if buffer.tell() > self.max_file_size and quality > 85:
             # Reduce quality if too large
             buffer = io.BytesIO()
             img.save(buffer, format=format, optimize=True, quality=85)
         
-        buffer.seek(0)
-        return buffer.read()
+        return buffer.getvalue()
+    
+    def _passthrough_bytes(
+        self,
+        image_path: Union[str, Path, bytes, Image.Image],
+        img: Image.Image,
+        target_size: Optional[Tuple[int, int]],
+        format: str
+    ) -> Optional[bytes]:
+        """Original bytes of a file/bytes input that needs no processing, else None"""
+        if img.format != format.upper() or img.size not in self.valid_dimensions:
+            return None
+        if target_size and tuple(target_size) != img.size:
+            return None
+        
+        if isinstance(image_path, bytes):
+            data = image_path
+        elif isinstance(image_path, (str, Path)) and not _URL_RE.match(str(image_path)):
+            if os.path.getsize(image_path) > self.max_file_size:
+                return None
+            data = Path(image_path).read_bytes()
+        else:
+            return None
+        return data if len(data) <= self.max_file_size else None
+    
+    def _pick_quality(self, img: Image.Image, format: str) -> int:
+        """
+        Choose the encode quality (95, or 85 when the output would exceed max_file_size)
+        
+        Only lossy formats with more raw pixel data than the limit can overflow, those
+        are judged from a quarter-scale probe encode instead of a full encode.
+        """
+        raw_size = img.width * img.height * len(img.getbands())
+        if format.upper() not in self.QUALITY_FORMATS or raw_size <= self.max_file_size:
+            return 95
+        
+        probe = img.resize((max(1, img.width // 4), max(1, img.height // 4)), Image.Resampling.BILINEAR)
+        buffer = io.BytesIO()
+        probe.save(buffer, format=format, quality=95)
+        return 85 if buffer.tell() * 16 > self.max_file_size * 0.9 else 95
     
     def _resize_image(
         self,
         img: Image.Image,
         target_size: Tuple[int, int],
-        maintain_aspect_ratio: bool
+        maintain_aspect_ratio: bool,
+        resample: Image.Resampling = Image.Resampling.LANCZOS
     ) -> Image.Image:
         """Resize image to target size"""
         if maintain_aspect_ratio:
-            img.thumbnail(target_size, Image.Resampling.LANCZOS)
+            img.thumbnail(target_size, resample)
             
             # Create new image with target size and paste resized image
             new_img = Image.new(img.mode, target_size, (255, 255, 255) if img.mode == "RGB" else (255, 255, 255, 0))
@@ -98,21 +246,38 @@ class ImageProcessor:
             
             return new_img
         else:
-            return img.resize(target_size, Image.Resampling.LANCZOS)
+            return img.resize(target_size, resample)
     
-    def _auto_resize_to_valid(self, img: Image.Image) -> Image.Image:
-        """Auto-resize to nearest valid dimension"""
-        current_size = (img.width, img.height)
-        
-        # Find nearest valid dimension
-        best_size = min(
+    def _nearest_valid_size(self, current_size: Tuple[int, int]) -> Tuple[int, int]:
+        """Nearest valid dimension (by width + height difference) to a size"""
+        return min(
             self.valid_dimensions,
             key=lambda s: abs(s[0] - current_size[0]) + abs(s[1] - current_size[1])
         )
+    
+    def _draft_for_size(self, img: Image.Image, size: Tuple[int, int]) -> None:
+        """
+        Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding
+        
+        Keeps at least twice the target size (the same margin Image.thumbnail
+        uses) so the final resample quality is unchanged.
+        """
+        if img.width > 2 * size[0] and img.height > 2 * size[1]:
+            img.draft(img.mode, (2 * size[0], 2 * size[1]))
+    
+    def _auto_resize_to_valid(
+        self,
+        img: Image.Image,
+        resample: Image.Resampling = Image.Resampling.BILINEAR
+    ) -> Image.Image:
+        """Auto-resize to nearest valid dimension"""
+        current_size = (img.width, img.height)
         
         # Only resize if current size is not valid
         if current_size not in self.valid_dimensions:
-            return self._resize_image(img, best_size, maintain_aspect_ratio=True)
+            return self._resize_image(
+                img, self._nearest_valid_size(current_size), maintain_aspect_ratio=True, resample=resample
+            )
         
         return img
     
@@ -131,18 +296,21 @@ class ImageProcessor:
             mask_data: Additional data for mask creation
             
         Returns:
-            Mask image as bytes (PNG with alpha channel)
+            Mask image as bytes (grayscale+alpha PNG, alpha holds the mask)
         """
         # Load reference image to get dimensions
-        if isinstance(image, Image.Image):
-            ref_img = image
-        elif isinstance(image, bytes):
-            ref_img = Image.open(io.BytesIO(image))
-        else:
-            ref_img = Image.open(image)
+        ref_img = self._load_image(image)
         
         width, height = ref_img.size
         
+        # Masks depend only on dimensions and parameters, which repeat across a batch
+        key = (width, height, mask_type, _freeze(mask_data))
+        with self._mask_cache_lock:
+            cached = self._mask_cache.get(key)
+            if cached is not None:
+                self._mask_cache.move_to_end(key)
+                return cached
+        
         # Create mask based on type
         if mask_type == "center":
             mask = self._create_center_mask(width, height, mask_data)
@@ -154,15 +322,19 @@ class ImageProcessor:
             # Default to center mask
             mask = self._create_center_mask(width, height)
         
-        # Ensure mask has alpha channel
-        if mask.mode != "RGBA":
-            mask = mask.convert("RGBA")
+        # The edit API reads the mask from the alpha channel: black luminance with the mask as alpha
+        mask = Image.merge("LA", (Image.new("L", (width, height), 0), mask))
         
-        # Convert to bytes
+        # Convert to bytes (fastest deflate level, masks are smooth and compress well regardless)
         buffer = io.BytesIO()
-        mask.save(buffer, format="PNG")
-        buffer.seek(0)
-        return buffer.read()
+        mask.save(buffer, format="PNG", optimize=False, compress_level=1)
+        mask_bytes = buffer.getvalue()
+        
+        with self._mask_cache_lock:
+            self._mask_cache[key] = mask_bytes
+            if len(self._mask_cache) > self.MASK_CACHE_SIZE:
+                self._mask_cache.popitem(last=False)
+        return mask_bytes
     
     def _create_center_mask(
         self,
@@ -170,37 +342,38 @@ class ImageProcessor:
         height: int,
         params: Optional[dict] = None
     ) -> Image.Image:
-        """Create a centered circular/elliptical mask"""
+        """Create a centered circular/elliptical mask (L mode, 255 = masked)"""
         # Default parameters
         size_ratio = 0.5
         if params:
             size_ratio = params.get("size_ratio", 0.5)
         
-        # Create mask
-        mask = Image.new("L", (width, height), 0)
-        
         # Calculate ellipse bounds
         center_x, center_y = width // 2, height // 2
-        radius_x = int(width * size_ratio / 2)
-        radius_y = int(height * size_ratio / 2)
-        
-        # Draw ellipse
-        from PIL import ImageDraw
-        draw = ImageDraw.Draw(mask)
-        draw.ellipse(
-            [center_x - radius_x, center_y - radius_y,
-             center_x + radius_x, center_y + radius_y],
-            fill=255
-        )
-        
-        # Apply gaussian blur for smooth edges
-        mask = mask.filter(ImageFilter.GaussianBlur(radius=10))
-        
-        # Convert to RGBA
-        mask_rgba = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-        mask_rgba.putalpha(mask)
-        
-        return mask_rgba
+        radius_x = max(int(width * size_ratio / 2), 1)
+        radius_y = max(int(height * size_ratio / 2), 1)
+        
+        # Normalized pixel-center offsets per column and row, broadcast into the full grid
+        dx = (np.arange(width, dtype=np.float32) - center_x + 0.5) / radius_x
+        dy = (np.arange(height, dtype=np.float32) - center_y + 0.5) / radius_y
+        
+        # Approximate signed distance to the ellipse edge in pixels: (d - 1) / |grad d|
+        distance = (dx * dx)[None, :] + (dy * dy)[:, None]
+        distance -= 1.0
+        gradient = ((dx / radius_x) ** 2)[None, :] + ((dy / radius_y) ** 2)[:, None]
+        np.sqrt(gradient, out=gradient)
+        gradient *= 2.0
+        distance /= gradient
+        
+        # Smooth edge in the same pass, a logistic fit of a Gaussian blur with sigma 10
+        distance *= 1.702 / 10
+        np.clip(distance, -50, 50, out=distance)
+        np.exp(distance, out=distance)
+        distance += 1.0
+        alpha = np.divide(255.0, distance, dtype=np.float32)
+        alpha += 0.5
+        
+        return Image.fromarray(alpha.astype(np.uint8), mode="L")
     
     def _create_edge_mask(
         self,
@@ -208,7 +381,7 @@ class ImageProcessor:
         height: int,
         params: Optional[dict] = None
     ) -> Image.Image:
-        """Create a mask for edges/borders"""
+        """Create a mask for edges/borders (L mode, 255 = masked)"""
         border_width = 100
         if params:
             border_width = params.get("border_width", 100)
@@ -216,7 +389,6 @@ class ImageProcessor:
         # Create mask with border
         mask = Image.new("L", (width, height), 255)
         
-        from PIL import ImageDraw
         draw = ImageDraw.Draw(mask)
         draw.rectangle(
             [border_width, border_width, width - border_width, height - border_width],
@@ -226,11 +398,7 @@ class ImageProcessor:
         # Apply blur for smooth transition
         mask = mask.filter(ImageFilter.GaussianBlur(radius=20))
         
-        # Convert to RGBA
-        mask_rgba = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-        mask_rgba.putalpha(mask)
-        
-        return mask_rgba
+        return mask
     
     def _create_custom_mask(
         self,
@@ -238,10 +406,9 @@ class ImageProcessor:
         height: int,
         coordinates: List[Tuple[int, int]]
     ) -> Image.Image:
-        """Create a custom polygon mask from coordinates"""
+        """Create a custom polygon mask from coordinates (L mode, 255 = masked)"""
         mask = Image.new("L", (width, height), 0)
         
-        from PIL import ImageDraw
         draw = ImageDraw.Draw(mask)
         
         if len(coordinates) >= 3:
@@ -250,11 +417,7 @@ class ImageProcessor:
         # Apply slight blur
         mask = mask.filter(ImageFilter.GaussianBlur(radius=5))
         
-        # Convert to RGBA
-        mask_rgba = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-        mask_rgba.putalpha(mask)
-        
-        return mask_rgba
+        return mask
     
     def add_alpha_channel(
         self,
@@ -270,31 +433,20 @@ class ImageProcessor:
             Image with alpha channel as bytes
         """
         # Load image
-        if isinstance(image, Image.Image):
-            img = image
-        elif isinstance(image, bytes):
-            img = Image.open(io.BytesIO(image))
-        else:
-            img = Image.open(image)
+        img = self._load_image(image)
         
-        # Convert to RGBA if needed
+        # Convert to RGBA if needed, in one conversion whatever the source mode
         if img.mode != "RGBA":
-            if img.mode == "RGB":
-                img = img.convert("RGBA")
-            elif img.mode == "L":
+            source = img
+            img = img.convert("RGBA")
+            if source.mode == "L":
                 # For grayscale, use the image itself as alpha
-                img_rgba = img.convert("RGBA")
-                img_rgba.putalpha(img)
-                img = img_rgba
-            elif img.mode == "P":
-                # For palette images
-                img = img.convert("RGBA")
+                img.putalpha(source)
         
-        # Convert to bytes
+        # Convert to bytes (fastest deflate level, this is an intermediate API payload)
         buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-        return buffer.read()
+        img.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
     
     def optimize_for_transparency(
         self,
@@ -312,46 +464,50 @@ class ImageProcessor:
             Optimized image as bytes
         """
         # Load image
-        if isinstance(image, Image.Image):
-            img = image
-        elif isinstance(image, bytes):
-            img = Image.open(io.BytesIO(image))
-        else:
-            img = Image.open(image)
+        img = self._load_image(image)
         
         # Convert to RGBA
         if img.mode != "RGBA":
             img = img.convert("RGBA")
         
-        # Get data as numpy array
+        # Get data as a writable numpy array, modified in place below
         data = np.array(img)
         
-        # Find white or near-white pixels
-        r, g, b, a = data[:, :, 0], data[:, :, 1], data[:, :, 2], data[:, :, 3]
-        white_pixels = (r > threshold) & (g > threshold) & (b > threshold)
-        
-        # Make white pixels transparent
-        data[white_pixels] = [255, 255, 255, 0]
+        if NUMBA_AVAILABLE:
+            _make_white_transparent(data, threshold)
+        else:
+            # Find white or near-white pixels, ANDed in place per channel (a reduction over
+            # the short RGB axis is several times slower)
+            white_pixels = data[..., 0] > threshold
+            white_pixels &= data[..., 1] > threshold
+            white_pixels &= data[..., 2] > threshold
+            
+            # Make white pixels transparent (near-white RGB is snapped to pure white as before),
+            # one 32-bit store per pixel instead of four byte stores
+            np.putmask(data.view(np.uint32)[..., 0], white_pixels, _TRANSPARENT_WHITE)
         
-        # Create new image
+        # Create new image (wraps the array's buffer without copying)
         new_img = Image.fromarray(data, mode="RGBA")
         
         # Convert to bytes
         buffer = io.BytesIO()
         new_img.save(buffer, format="PNG")
-        buffer.seek(0)
-        return buffer.read()
+        return buffer.getvalue()
     
     def batch_process(
         self,
         images: List[Union[str, Path, bytes]],
         target_size: Optional[Tuple[int, int]] = None,
-        format: str = "PNG"
+        format: str = "PNG",
+        max_workers: Optional[int] = None
     ) -> List[bytes]:
-        """Process multiple images in batch"""
-        processed = []
-        for image in images:
-            processed.append(
-                self.prepare_input_image(image, target_size, format=format)
-            )
-        return processed
\ No newline at end of file
+        """Process multiple images in batch, in parallel threads (PIL releases the GIL while coding images)"""
+        if len(images) <= 1:
+            return [self.prepare_input_image(image, target_size, format=format) for image in images]
+        
+        workers = max_workers or min(len(images), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(
+                lambda image: self.prepare_input_image(image, target_size, format=format),
+                images
+            ))
\ No newline at end of file
@@ -3,31 +3,231 @@ Prompt Optimizer for Better GPT Image
 Enhances user prompts for better image generation results
 """
 
+import asyncio
+import functools
+import hashlib
+import importlib
+import importlib.util
+import logging
 import re
-from typing import Dict, List, Optional, Tuple, Any
-from openai import OpenAI
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Any
 import json
-from .style_presets import STYLE_PRESETS, get_style_list
-import sys
+import httpx
+from openai import AsyncOpenAI, NotFoundError
+from .style_presets import STYLE_PRESETS, STYLE_KEYWORDS, get_style_list, get_style_tail
+from .cache import ResultCache, SemanticCache, cached
+from .clients import get_client, new_async_client
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=1)
+def _load_system_prompt() -> Optional[str]:
+    """
+    Load the structured image description system prompt on first use
+    
+    Taken from an importable image_optimizer_prompt module, else from the one in
+    the project root (None if there is neither). Stripped once, so the prompt is
+    sent byte-identical as the first message of every call and OpenAI's automatic
+    prompt caching can reuse the prefix across requests.
+    """
+    try:
+        module = importlib.import_module("image_optimizer_prompt")
+    except ImportError:
+        path = Path(__file__).resolve().parent.parent / "image_optimizer_prompt.py"
+        spec = importlib.util.spec_from_file_location("image_optimizer_prompt", path)
+        module = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(module)
+        except FileNotFoundError:
+            # Fallback if custom prompt not available
+            return None
+    system_prompt = getattr(module, "SYSTEM_PROMPT_STRUCTURED_IMAGE_DESCRIPTION", None)
+    return system_prompt.strip() if system_prompt else None
+
+
+@functools.lru_cache(maxsize=1)
+def _system_messages() -> Tuple[Dict[str, str], ...]:
+    system_prompt = _load_system_prompt()
+    return ({"role": "system", "content": system_prompt},) if system_prompt else ()
+
+
+@functools.lru_cache(maxsize=1)
+def system_prompt_version() -> str:
+    """Fingerprint of the system prompt, so cached enhancements expire when it is edited"""
+    return hashlib.sha256((_load_system_prompt() or "").encode("utf-8")).hexdigest()[:16]
+
+# Empty items left in a comma list, cleaned from rule-based enhancements
+_RE_DOUBLE_COMMA = re.compile(r',\s*,')
+
+# Main subject of a prompt for analyze_intent: the words after its first article
+_RE_SUBJECT = re.compile(r'\b(?:a|an|the)\s+([a-zA-Z\s]+?)(?:\s+(?:with|in|at|on)|[,.])', re.I)
+
+# tiktoken is optional, only used for local token estimates
 try:
-    from image_optimizer_prompt import SYSTEM_PROMPT_STRUCTURED_IMAGE_DESCRIPTION
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
 except ImportError:
-    # Fallback if custom prompt not available
-    SYSTEM_PROMPT_STRUCTURED_IMAGE_DESCRIPTION = None
+    TIKTOKEN_AVAILABLE = False
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken, or estimate (~4 characters per token) without it"""
+    if TIKTOKEN_AVAILABLE:
+        return len(_get_encoding().encode(text))
+    return (len(text) + 3) // 4
+
+
+@functools.lru_cache(maxsize=1)
+def system_prompt_tokens() -> int:
+    """Token count of the system prompt, computed once on first use"""
+    return count_tokens(_load_system_prompt() or "")
+
+
+def _log_prompt_cache_usage(response: Any) -> None:
+    """Log how many prompt tokens OpenAI served from its prefix cache"""
+    usage = getattr(response, "usage", None)
+    if usage is None or not logger.isEnabledFor(logging.DEBUG):
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) or 0
+    logger.debug("Enhancement used %d prompt tokens, %d cached", usage.prompt_tokens, cached_tokens)
+
+
+def _enhancement_succeeded(result: Tuple[str, Optional[str], Dict[str, Any]]) -> bool:
+    """Check an enhance_prompt result did not silently fall back after a GPT failure"""
+    enhanced_prompt, _, metadata = result
+    if "gpt_enhancement_error" in metadata:
+        return False
+    return not metadata.get("gpt_enhanced") or enhanced_prompt != metadata["original_prompt"]
+
+
+# enhance_prompt and enhance_prompt_async share one namespace, so either reuses the other's results
+_cache_enhancement = cached(
+    "enhance_prompt",
+    key_extra=lambda self: {
+        "optimization_model": self.optimization_model,
+        "system_prompt_version": system_prompt_version()
+    },
+    should_cache=_enhancement_succeeded,
+    restore=tuple
+)
 
 
 class PromptOptimizer:
     """Optimizes prompts for image generation using GPT models"""
     
     # Default optimization model (can be overridden)
-    # Using GPT-5 as default - latest and most advanced
-    DEFAULT_OPTIMIZATION_MODEL = "gpt-5"  # Latest model for best results
+    DEFAULT_OPTIMIZATION_MODEL = "gpt-4o-mini"  # Small, fast model is enough for prompt rewriting
+    
+    # Number of enhanced prompts remembered in memory
+    DEFAULT_CACHE_SIZE = 512
+    
+    # Embedding model of the opt-in semantic cache, and the entries it keeps
+    EMBEDDING_MODEL = "text-embedding-3-small"
+    SEMANTIC_CACHE_SIZE = 10000
     
-    def __init__(self, api_key: str, optimization_model: str = None):
-        self.client = OpenAI(api_key=api_key)
+    # Concurrent GPT calls per batch (rate limit errors are retried by the SDK, honoring Retry-After)
+    BATCH_CONCURRENCY = 10
+    
+    # Prompts longer than this that already name their style skip the GPT call
+    DETAILED_PROMPT_LENGTH = 400
+    # So do prompts of more words than this that already ask for detail and quality,
+    # and prompts too short to have a subject
+    DETAILED_PROMPT_WORDS = 40
+    QUALITY_MARKERS = ("highly detailed", "8k", "cinematic lighting", "intricate details", "professional quality")
+    MIN_PROMPT_LENGTH = 3
+    
+    # Output cap of an enhancement (increased for detailed structured descriptions), lowered
+    # when the prompt leaves less room in the model's context window
+    MAX_ENHANCEMENT_TOKENS = 800
+    MIN_ENHANCEMENT_TOKENS = 100
+    CONTEXT_TOKEN_MARGIN = 50
+    # Context windows of requested models, unknown models get the smallest
+    CONTEXT_WINDOWS = {
+        "gpt-4": 8192,
+        "gpt-4-turbo-preview": 128000,
+        "gpt-4o-mini": 128000
+    }
+    
+    # Retries on rate limit / transient errors, with exponential backoff (SDK built-in)
+    DEFAULT_MAX_RETRIES = 5
+    
+    # Enhancements are short completions, so fail a hung call sooner than the SDK's 10 minutes
+    REQUEST_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+    
+    # Model used when the requested optimization model does not exist for the account
+    FALLBACK_MODEL = "gpt-4"
+    
+    # Model names mapped to the model actually requested, for API compatibility
+    _MODEL_ALIASES = {
+        "gpt-5": "gpt-4-turbo-preview",  # Map GPT-5 to latest turbo
+        "gpt-4.1": "gpt-4-turbo-preview"  # GPT-4.1 also uses turbo
+    }
+    
+    # Intent keywords, one compiled alternation per style/mood (checked in order, first match wins)
+    _STYLE_PATTERNS = tuple(
+        (style, re.compile("|".join(map(re.escape, keywords))))
+        for style, keywords in {
+            "photorealistic": ["photo", "realistic", "real", "photography"],
+            "cinematic": ["cinematic", "movie", "film", "dramatic"],
+            "anime": ["anime", "manga", "kawaii", "chibi"],
+            "oil_painting": ["oil painting", "painting", "traditional art", "canvas"],
+            "3d_render": ["3d", "render", "cgi", "digital sculpture"],
+            "concept_art": ["concept art", "illustration", "design", "artwork"]
+        }.items()
+    )
+    _MOOD_PATTERNS = tuple(
+        (mood, re.compile("|".join(map(re.escape, keywords))))
+        for mood, keywords in {
+            "dramatic": ["dramatic", "intense", "powerful", "epic"],
+            "peaceful": ["peaceful", "calm", "serene", "tranquil"],
+            "mysterious": ["mysterious", "enigmatic", "mystical", "magical"],
+            "cheerful": ["happy", "cheerful", "bright", "joyful", "vibrant"],
+            "dark": ["dark", "gloomy", "ominous", "gothic", "noir"]
+        }.items()
+    )
+    
+    def __init__(
+        self,
+        api_key: str,
+        optimization_model: str = None,
+        cache_dir: Optional[str] = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        semantic_threshold: Optional[float] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES
+    ):
+        # Copy of the shared client (same connection pool) with a shorter timeout
+        self.client = get_client(api_key).with_options(timeout=self.REQUEST_TIMEOUT, max_retries=max_retries)
+        # Async client for concurrent enhancements, created per event loop on first use
+        self._api_key = api_key
+        self._max_retries = max_retries
+        self._async_client = None
+        self._async_client_loop = None
         self.optimization_model = optimization_model or self.DEFAULT_OPTIMIZATION_MODEL
+        # Unavailable models -> the fallback that worked for them, so they are not retried every call
+        self._effective_models = {}
+        
+        # Cache of enhanced prompts: in-memory LRU, plus on disk when a directory is set
+        cache_dir = cache_dir or os.getenv("BGI_CACHE_DIR")
+        if cache_dir or cache_size:
+            self.result_cache = ResultCache(cache_dir, maxsize=cache_size)
+        else:
+            self.result_cache = None
+        
+        # Opt-in: reuse enhancements of near-identical prompts (cosine similarity >= threshold)
+        if semantic_threshold:
+            self.semantic_cache = SemanticCache(semantic_threshold, self.SEMANTIC_CACHE_SIZE)
+        else:
+            self.semantic_cache = None
         
         # Use comprehensive style presets from style_presets.py
         self.style_presets = STYLE_PRESETS
@@ -48,6 +248,10 @@ class PromptOptimizer:
             "oil_painting": ["digital art", "3d render", "photograph", "modern art"],
             "3d_render": ["2d", "flat", "painting", "photograph", "hand-drawn"]
         }
+        # Joined once, as returned with every enhancement
+        self._negative_prompts = {
+            style: ", ".join(suggestions) for style, suggestions in self.negative_suggestions.items()
+        }
 
     def analyze_intent(self, prompt: str) -> Dict[str, any]:
         """Analyze user intent from the prompt"""
@@ -61,40 +265,41 @@ class PromptOptimizer:
         
         # Detect style keywords
         prompt_lower = prompt.lower()
-        for style, keywords in {
-            "photorealistic": ["photo", "realistic", "real", "photography"],
-            "cinematic": ["cinematic", "movie", "film", "dramatic"],
-            "anime": ["anime", "manga", "kawaii", "chibi"],
-            "oil_painting": ["oil painting", "painting", "traditional art", "canvas"],
-            "3d_render": ["3d", "render", "cgi", "digital sculpture"],
-            "concept_art": ["concept art", "illustration", "design", "artwork"]
-        }.items():
-            if any(keyword in prompt_lower for keyword in keywords):
+        for style, pattern in self._STYLE_PATTERNS:
+            if pattern.search(prompt_lower):
                 intent["style"] = style
                 break
         
         # Extract main subject (simplified - could use NLP)
         # This is a basic implementation
-        subjects = re.findall(r'\b(?:a|an|the)\s+([a-zA-Z\s]+?)(?:\s+(?:with|in|at|on)|[,.])', prompt, re.I)
-        if subjects:
-            intent["subject"] = subjects[0].strip()
+        subject = _RE_SUBJECT.search(prompt)
+        if subject:
+            intent["subject"] = subject.group(1).strip()
         
         # Detect mood/atmosphere
-        moods = {
-            "dramatic": ["dramatic", "intense", "powerful", "epic"],
-            "peaceful": ["peaceful", "calm", "serene", "tranquil"],
-            "mysterious": ["mysterious", "enigmatic", "mystical", "magical"],
-            "cheerful": ["happy", "cheerful", "bright", "joyful", "vibrant"],
-            "dark": ["dark", "gloomy", "ominous", "gothic", "noir"]
-        }
-        
-        for mood, keywords in moods.items():
-            if any(keyword in prompt_lower for keyword in keywords):
+        for mood, pattern in self._MOOD_PATTERNS:
+            if pattern.search(prompt_lower):
                 intent["mood"] = mood
                 break
         
         return intent
 
+    def _get_async_client(self) -> AsyncOpenAI:
+        """Get the async client for the running event loop (its connection pool is loop-bound)"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = new_async_client(self._api_key, self._max_retries, self.REQUEST_TIMEOUT)
+            self._async_client_loop = loop
+        return self._async_client
+    
+    async def aclose(self) -> None:
+        """Close the async client of the running event loop"""
+        if self._async_client is not None and self._async_client_loop is asyncio.get_running_loop():
+            await self._async_client.close()
+        self._async_client = None
+        self._async_client_loop = None
+    
+    @_cache_enhancement
     def enhance_prompt(
         self,
         prompt: str,
@@ -110,102 +315,301 @@ class PromptOptimizer:
         Returns:
             Tuple of (enhanced_prompt, suggested_negative_prompt, metadata)
         """
-        metadata = {"original_prompt": prompt}
+        metadata, use_gpt_enhancement = self._start_enhancement(prompt, style_preset, use_gpt_enhancement)
         
         # Use GPT for intelligent enhancement if requested
+        enhanced_prompt = None
+        if use_gpt_enhancement:
+            model = optimization_model or self.optimization_model
+            embedding = None
+            if self.semantic_cache is not None:
+                embedding = self._embed(prompt)
+                enhanced_prompt = self._semantic_lookup(embedding, style_preset, model, metadata)
+            if enhanced_prompt is None:
+                try:
+                    # Simple intent for GPT - not needed for complex analysis
+                    enhanced_prompt = self._gpt_enhance(prompt, style_preset, {}, model)
+                except Exception as e:
+                    self._record_gpt_failure(metadata, e)
+                else:
+                    self._record_gpt_success(metadata, model, style_preset)
+                    self._semantic_store(embedding, style_preset, model, prompt, enhanced_prompt)
+        
+        return self._finish_enhancement(prompt, style_preset, add_quality_modifiers, enhanced_prompt, metadata)
+    
+    @_cache_enhancement
+    async def enhance_prompt_async(
+        self,
+        prompt: str,
+        style_preset: Optional[str] = None,
+        auto_detect_style: bool = True,
+        add_quality_modifiers: bool = True,
+        use_gpt_enhancement: bool = True,
+        optimization_model: Optional[str] = None
+    ) -> Tuple[str, Optional[str], Dict[str, any]]:
+        """Async version of enhance_prompt (shares its cache)"""
+        metadata, use_gpt_enhancement = self._start_enhancement(prompt, style_preset, use_gpt_enhancement)
+        
+        enhanced_prompt = None
         if use_gpt_enhancement:
+            model = optimization_model or self.optimization_model
+            embedding = None
+            if self.semantic_cache is not None:
+                embedding = await self._embed_async(prompt)
+                enhanced_prompt = self._semantic_lookup(embedding, style_preset, model, metadata)
+            if enhanced_prompt is None:
+                try:
+                    enhanced_prompt = await self._gpt_enhance_async(prompt, style_preset, {}, model)
+                except Exception as e:
+                    self._record_gpt_failure(metadata, e)
+                else:
+                    self._record_gpt_success(metadata, model, style_preset)
+                    self._semantic_store(embedding, style_preset, model, prompt, enhanced_prompt)
+        
+        return self._finish_enhancement(prompt, style_preset, add_quality_modifiers, enhanced_prompt, metadata)
+    
+    def enhance_prompt_stream(
+        self,
+        prompt: str,
+        style_preset: Optional[str] = None,
+        add_quality_modifiers: bool = True,
+        optimization_model: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        Stream the enhanced prompt as GPT generates it, for progressive display
+        
+        Yields text fragments that join into the enhanced prompt. Results are not
+        cached. If GPT fails before producing any text (or is not needed), the
+        rule-based enhancement is yielded in one piece instead.
+        """
+        produced = False
+        if self._needs_gpt(prompt, style_preset):
+            model = optimization_model or self.optimization_model
             try:
-                model = optimization_model or self.optimization_model
-                # Simple intent for GPT - not needed for complex analysis
-                intent = {}
-                enhanced_prompt = self._gpt_enhance(prompt, style_preset, intent, model)
-                metadata["gpt_enhanced"] = True
-                metadata["optimization_model"] = model
-                metadata["applied_style"] = style_preset if style_preset else "none"
+                for text in self._gpt_enhance_stream(prompt, style_preset, model):
+                    produced = True
+                    yield text
             except Exception as e:
-                # Fallback to rule-based if GPT fails
-                print(f"GPT enhancement failed, using rule-based: {e}")
-                metadata["gpt_enhancement_error"] = str(e)
-                enhanced_prompt = self._rule_based_enhance(prompt, style_preset, add_quality_modifiers)
-                metadata["gpt_enhanced"] = False
-        else:
-            # Rule-based enhancement
+                # Text already shown cannot be taken back
+                if produced:
+                    raise
+                logger.warning("GPT enhancement failed, using rule-based: %s", e)
+        
+        if not produced:
+            yield self._rule_based_enhance(prompt, style_preset, add_quality_modifiers)
+    
+    def _start_enhancement(
+        self,
+        prompt: str,
+        style_preset: Optional[str],
+        use_gpt_enhancement: bool
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Initial metadata, and whether the GPT round-trip is still worth making"""
+        metadata = {"original_prompt": prompt}
+        
+        # Already detailed, styled prompts are enhanced locally instead of by GPT
+        if use_gpt_enhancement and not self._needs_gpt(prompt, style_preset):
+            use_gpt_enhancement = False
+            metadata["short_circuit"] = True
+        return metadata, use_gpt_enhancement
+    
+    def _record_gpt_success(self, metadata: Dict[str, Any], model: str, style_preset: Optional[str]) -> None:
+        metadata["gpt_enhanced"] = True
+        metadata["optimization_model"] = model
+        metadata["applied_style"] = style_preset if style_preset else "none"
+    
+    def _record_gpt_failure(self, metadata: Dict[str, Any], error: Exception) -> None:
+        # Fallback to rule-based if GPT fails
+        logger.warning("GPT enhancement failed, using rule-based: %s", error)
+        metadata["gpt_enhancement_error"] = str(error)
+    
+    def _embed(self, prompt: str) -> Optional[List[float]]:
+        """Embed a prompt for the semantic cache (None if the call fails)"""
+        try:
+            return self.client.embeddings.create(model=self.EMBEDDING_MODEL, input=prompt).data[0].embedding
+        except Exception as e:
+            logger.warning("Prompt embedding failed, skipping semantic cache: %s", e)
+            return None
+    
+    async def _embed_async(self, prompt: str) -> Optional[List[float]]:
+        """Async version of _embed"""
+        try:
+            response = await self._get_async_client().embeddings.create(model=self.EMBEDDING_MODEL, input=prompt)
+            return response.data[0].embedding
+        except Exception as e:
+            logger.warning("Prompt embedding failed, skipping semantic cache: %s", e)
+            return None
+    
+    def _semantic_lookup(
+        self,
+        embedding: Optional[List[float]],
+        style_preset: Optional[str],
+        model: str,
+        metadata: Dict[str, Any]
+    ) -> Optional[str]:
+        """Enhancement of a near-identical earlier prompt with the same style and model, if any"""
+        if embedding is None:
+            return None
+        enhanced_prompt = self.semantic_cache.get(embedding, (style_preset, model))
+        if enhanced_prompt is not None:
+            metadata["semantic_cache_hit"] = True
+            self._record_gpt_success(metadata, model, style_preset)
+        return enhanced_prompt
+    
+    def _semantic_store(
+        self,
+        embedding: Optional[List[float]],
+        style_preset: Optional[str],
+        model: str,
+        prompt: str,
+        enhanced_prompt: str
+    ) -> None:
+        # The original prompt coming back means GPT failed silently
+        if embedding is not None and enhanced_prompt != prompt:
+            self.semantic_cache.set(embedding, (style_preset, model), enhanced_prompt)
+    
+    def _finish_enhancement(
+        self,
+        prompt: str,
+        style_preset: Optional[str],
+        add_quality_modifiers: bool,
+        enhanced_prompt: Optional[str],
+        metadata: Dict[str, Any]
+    ) -> Tuple[str, Optional[str], Dict[str, any]]:
+        """Apply the rule-based enhancement if GPT was not used, then add the negative prompt and stats"""
+        if enhanced_prompt is None:
             enhanced_prompt = self._rule_based_enhance(prompt, style_preset, add_quality_modifiers)
             metadata["gpt_enhanced"] = False
         
         # Generate negative prompt suggestion based on style
-        negative_prompt = None
-        if style_preset in self.negative_suggestions:
-            negative_prompt = ", ".join(self.negative_suggestions[style_preset])
+        negative_prompt = self._negative_prompts.get(style_preset)
         
         metadata["final_length"] = len(enhanced_prompt)
         metadata["enhancement_ratio"] = len(enhanced_prompt) / len(prompt) if prompt else 0
         
         return enhanced_prompt, negative_prompt, metadata
     
+    def _needs_gpt(self, prompt: str, style_preset: Optional[str]) -> bool:
+        """Check whether a prompt still benefits from a GPT enhancement round-trip"""
+        if len(prompt.strip()) < self.MIN_PROMPT_LENGTH:
+            return False
+        
+        prompt_lower = None
+        if len(prompt.split()) > self.DETAILED_PROMPT_WORDS:
+            prompt_lower = prompt.lower()
+            if any(marker in prompt_lower for marker in self.QUALITY_MARKERS):
+                return False
+        
+        if len(prompt) <= self.DETAILED_PROMPT_LENGTH or style_preset not in STYLE_KEYWORDS:
+            return True
+        prompt_lower = prompt_lower or prompt.lower()
+        return not any(keyword in prompt_lower for keyword in STYLE_KEYWORDS[style_preset])
+    
     def _rule_based_enhance(self, prompt: str, style_preset: Optional[str], add_quality_modifiers: bool) -> str:
         """Fallback rule-based enhancement when GPT is not available"""
-        enhanced_parts = []
-        
-        # Add style prefix if available
-        if style_preset and style_preset in self.style_presets:
-            preset = self.style_presets[style_preset]
-            enhanced_parts.append(preset["prefix"])
-        
-        # Add original prompt
-        enhanced_parts.append(prompt)
-        
-        # Add style modifiers and suffix
-        if style_preset and style_preset in self.style_presets:
-            preset = self.style_presets[style_preset]
-            if add_quality_modifiers:
-                enhanced_parts.extend(preset["modifiers"][:2])
-            enhanced_parts.append(preset["suffix"])
+        tail = get_style_tail(style_preset, add_quality_modifiers) if style_preset else None
+        
+        if tail is not None:
+            # Style prefix, original prompt, then the pre-joined modifiers and suffix
+            enhanced_parts = [STYLE_PRESETS[style_preset]["prefix"], prompt, tail]
         elif add_quality_modifiers:
             # Add generic quality enhancers
-            enhanced_parts.extend(self.quality_enhancers[:3])
+            enhanced_parts = [prompt, *self.quality_enhancers[:3]]
+        else:
+            enhanced_parts = [prompt]
         
-        # Construct and clean final prompt
-        enhanced_prompt = ", ".join(filter(None, enhanced_parts))
-        enhanced_prompt = re.sub(r',\s*,', ',', enhanced_prompt)
-        enhanced_prompt = re.sub(r'\s+', ' ', enhanced_prompt).strip()
+        # Construct final prompt, collapsing whitespace runs to single spaces
+        enhanced_prompt = " ".join(", ".join([part for part in enhanced_parts if part]).split())
+        # Only a prompt with empty comma items of its own needs the regex
+        if ",," in enhanced_prompt or ", ," in enhanced_prompt:
+            enhanced_prompt = _RE_DOUBLE_COMMA.sub(',', enhanced_prompt)
         
         return enhanced_prompt
 
-    def _gpt_enhance(self, prompt: str, style: Optional[str], intent: Dict, model: str = None) -> str:
-        """Use GPT to enhance the prompt using the structured image description system"""
+    def _user_message(self, prompt: str, style: Optional[str]) -> str:
+        """Simple user message - just the prompt with optional style"""
+        if style and style != "none":
+            return f"{prompt}\n\nArt Style: {style}"
+        return prompt
+    
+    def estimate_input_tokens(self, prompt: str, style: Optional[str] = None) -> int:
+        """Estimate the input tokens of a GPT enhancement call (system prompt included)"""
+        return system_prompt_tokens() + count_tokens(self._user_message(prompt, style))
+    
+    def _completion_request(self, prompt: str, style: Optional[str], model: Optional[str]) -> Tuple[Dict[str, Any], str]:
+        """Chat completion arguments for enhancing a prompt, and the model name they were requested for"""
+        # Use specified model for prompt optimization
+        optimization_model = model or self.optimization_model
         
-        # Always use the custom system prompt for structured image description
-        system_prompt = SYSTEM_PROMPT_STRUCTURED_IMAGE_DESCRIPTION
+        # Map model names for API compatibility, then skip models known to be unavailable
+        requested_model = self._MODEL_ALIASES.get(optimization_model, optimization_model)
         
-        # Simple user message - just the prompt with optional style
-        if style and style != "none":
-            user_message = f"{prompt}\n\nArt Style: {style}"
-        else:
-            user_message = prompt
+        effective_model = self._effective_models.get(requested_model, requested_model)
+        user_message = self._user_message(prompt, style)
+        
+        request = {
+            "model": effective_model,
+            # Static system prompt first, everything request-specific in the user message
+            "messages": [*_system_messages(), {"role": "user", "content": user_message}],
+            "max_tokens": self._max_tokens(effective_model, user_message),
+            "temperature": 0.7
+        }
+        return request, requested_model
+    
+    def _max_tokens(self, model: str, user_message: str) -> int:
+        """Output budget of a call, raises ValueError (before any API call) if the prompt leaves too little"""
+        context = self.CONTEXT_WINDOWS.get(model, min(self.CONTEXT_WINDOWS.values()))
+        input_tokens = system_prompt_tokens() + count_tokens(user_message)
+        budget = min(self.MAX_ENHANCEMENT_TOKENS, context - input_tokens - self.CONTEXT_TOKEN_MARGIN)
+        if budget < self.MIN_ENHANCEMENT_TOKENS:
+            raise ValueError(f"Prompt too long for {model}: ~{input_tokens} input tokens, {context} token context")
+        return budget
+    
+    @staticmethod
+    def _model_missing(error: Exception) -> bool:
+        # Transient errors never get here, the SDK retries them; only a missing model is worth a fallback
+        if isinstance(error, NotFoundError):
+            return True
+        return "model_not_found" in str(error) or "does not exist" in str(error)
+    
+    def _fallback_request(
+        self,
+        request: Dict[str, Any],
+        requested_model: str,
+        error: Exception
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Request to retry a failed call with, or None when there is no fallback
+        
+        A remembered fallback that fails is forgotten, so the next call tries the
+        requested model again instead of repeating the failing one.
+        """
+        if request["model"] != requested_model:
+            self._effective_models.pop(requested_model, None)
+            return None
+        if self._model_missing(error):
+            # The fallback model can have a smaller context window
+            user_message = request["messages"][-1]["content"]
+            return {
+                **request,
+                "model": self.FALLBACK_MODEL,
+                "max_tokens": self._max_tokens(self.FALLBACK_MODEL, user_message)
+            }
+        return None
+    
+    def _remember_fallback(self, requested_model: str) -> None:
+        """Send later requests for an unavailable model straight to the fallback that worked"""
+        logger.info("Note: Using GPT-4 fallback for optimization")
+        self._effective_models[requested_model] = self.FALLBACK_MODEL
+    
+    def _gpt_enhance(self, prompt: str, style: Optional[str], intent: Dict, model: str = None) -> str:
+        """Use GPT to enhance the prompt using the structured image description system"""
+        request, requested_model = self._completion_request(prompt, style, model)
         
         try:
-            # Use specified model for prompt optimization
-            optimization_model = model or self.optimization_model
-            
-            # Map model names for API compatibility
-            if optimization_model == "gpt-5":
-                actual_model = "gpt-4-turbo-preview"  # Map GPT-5 to latest turbo
-            elif optimization_model == "gpt-4.1":
-                actual_model = "gpt-4-turbo-preview"  # GPT-4.1 also uses turbo
-            else:
-                actual_model = optimization_model
-            
             # Direct call to GPT with the structured prompt system
-            response = self.client.chat.completions.create(
-                model=actual_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                max_tokens=800,  # Increased for detailed structured descriptions
-                temperature=0.7
-            )
+            response = self.client.chat.completions.create(**request)
+            _log_prompt_cache_usage(response)
             
             # Extract and return the enhanced prompt
             if response and response.choices:
@@ -215,35 +619,266 @@ class PromptOptimizer:
                 return prompt
                 
         except Exception as e:
-            print(f"GPT enhancement failed: {e}")
+            logger.warning("GPT enhancement failed: %s", e)
             # Try fallback model if primary fails
-            if "model_not_found" in str(e) or "does not exist" in str(e):
+            fallback = self._fallback_request(request, requested_model, e)
+            if fallback:
                 try:
-                    # Fallback to GPT-4 if newer models not available
-                    response = self.client.chat.completions.create(
-                        model="gpt-4",  # Fallback to stable GPT-4
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_message}
-                        ],
-                        max_tokens=800,
-                        temperature=0.7
-                    )
+                    # Fallback to stable GPT-4 if newer models not available
+                    response = self.client.chat.completions.create(**fallback)
                     if response and response.choices:
-                        print("Note: Using GPT-4 fallback for optimization")
+                        self._remember_fallback(requested_model)
                         return response.choices[0].message.content.strip()
                 except:
                     pass
             
             return prompt  # Return original if all fails
+    
+    def _gpt_enhance_stream(self, prompt: str, style: Optional[str], model: str = None) -> Iterator[str]:
+        """Streaming version of _gpt_enhance, yields content deltas and raises on failure"""
+        request, requested_model = self._completion_request(prompt, style, model)
+        
+        try:
+            stream = self.client.chat.completions.create(**request, stream=True)
+        except Exception as e:
+            fallback = self._fallback_request(request, requested_model, e)
+            if not fallback:
+                raise
+            stream = self.client.chat.completions.create(**fallback, stream=True)
+            self._remember_fallback(requested_model)
+        
+        with stream:
+            for chunk in stream:
+                if chunk.choices:
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        yield content
+    
+    async def _gpt_enhance_async(self, prompt: str, style: Optional[str], intent: Dict, model: str = None) -> str:
+        """Async version of _gpt_enhance"""
+        request, requested_model = self._completion_request(prompt, style, model)
+        client = self._get_async_client()
+        
+        try:
+            response = await client.chat.completions.create(**request)
+            _log_prompt_cache_usage(response)
+            if response and response.choices:
+                return response.choices[0].message.content.strip()
+            return prompt
+        
+        except Exception as e:
+            logger.warning("GPT enhancement failed: %s", e)
+            fallback = self._fallback_request(request, requested_model, e)
+            if fallback:
+                try:
+                    response = await client.chat.completions.create(**fallback)
+                    if response and response.choices:
+                        self._remember_fallback(requested_model)
+                        return response.choices[0].message.content.strip()
+                except Exception:
+                    pass
+            
+            return prompt
 
-    def batch_enhance(self, prompts: List[str], **kwargs) -> List[Tuple[str, Optional[str], Dict]]:
-        """Enhance multiple prompts in batch"""
-        results = []
+    def batch_enhance(
+        self,
+        prompts: List[str],
+        max_concurrency: Optional[int] = None,
+        **kwargs
+    ) -> List[Tuple[str, Optional[str], Dict]]:
+        """Enhance multiple prompts in batch (concurrently, unless called from inside an event loop)"""
+        # Repeated prompts are enhanced once
+        unique = list(dict.fromkeys(prompts))
+        if len(unique) < len(prompts):
+            return self._scatter(prompts, unique, self.batch_enhance(unique, max_concurrency, **kwargs))
+        
+        # Rule-based enhancement is local CPU work, an event loop would only add overhead
+        if len(prompts) > 1 and kwargs.get("use_gpt_enhancement", True):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(self._run_batch(prompts, max_concurrency, **kwargs))
+        
+        # asyncio.run() is not allowed inside a running loop, use batch_enhance_async there
+        return [self.enhance_prompt(prompt, **kwargs) for prompt in prompts]
+    
+    async def _run_batch(
+        self,
+        prompts: List[str],
+        max_concurrency: Optional[int],
+        **kwargs
+    ) -> List[Tuple[str, Optional[str], Dict]]:
+        try:
+            return await self.batch_enhance_async(prompts, max_concurrency, **kwargs)
+        finally:
+            # The loop ends with this batch, so its client cannot be reused
+            await self.aclose()
+    
+    async def batch_enhance_async(
+        self,
+        prompts: List[str],
+        max_concurrency: Optional[int] = None,
+        **kwargs
+    ) -> List[Tuple[str, Optional[str], Dict]]:
+        """
+        Enhance multiple prompts concurrently, results in input order
+        
+        Args:
+            prompts: Prompts to enhance
+            max_concurrency: Most enhancements in flight at once (default: BATCH_CONCURRENCY)
+            **kwargs: Passed to enhance_prompt_async
+        """
+        unique = list(dict.fromkeys(prompts))
+        if len(unique) < len(prompts):
+            return self._scatter(prompts, unique, await self.batch_enhance_async(unique, max_concurrency, **kwargs))
+        
+        semaphore = asyncio.Semaphore(max_concurrency or self.BATCH_CONCURRENCY)
+        
+        async def enhance(prompt: str) -> Tuple[str, Optional[str], Dict]:
+            async with semaphore:
+                return await self.enhance_prompt_async(prompt, **kwargs)
+        
+        return list(await asyncio.gather(*(enhance(prompt) for prompt in prompts)))
+
+    @staticmethod
+    def _scatter(
+        prompts: List[str],
+        unique: List[str],
+        results: List[Tuple[str, Optional[str], Dict]]
+    ) -> List[Tuple[str, Optional[str], Dict]]:
+        """Map results of the unique prompts back to every input position"""
+        by_prompt = dict(zip(unique, results))
+        scattered = []
+        seen = set()
         for prompt in prompts:
-            results.append(self.enhance_prompt(prompt, **kwargs))
+            enhanced_prompt, negative_prompt, metadata = by_prompt[prompt]
+            # Repeats get their own metadata dict, so callers can edit one safely
+            if prompt in seen:
+                metadata = dict(metadata)
+            seen.add(prompt)
+            scattered.append((enhanced_prompt, negative_prompt, metadata))
+        return scattered
+    
+    def batch_enhance_offline(
+        self,
+        prompts: List[str],
+        style_preset: Optional[str] = None,
+        add_quality_modifiers: bool = True,
+        optimization_model: Optional[str] = None,
+        poll_interval: float = 30.0,
+        timeout: Optional[float] = None
+    ) -> List[Tuple[str, Optional[str], Dict]]:
+        """
+        Enhance a large batch of prompts through the OpenAI Batch API
+        
+        Batch jobs cost about half as much as regular calls and do not count
+        against the per-minute rate limits, but can take up to 24 hours. This
+        call blocks, polling until the job finishes. Prompts that fail (or the
+        whole batch, on error or timeout) fall back to rule-based enhancement.
+        
+        Args:
+            prompts: Prompts to enhance
+            style_preset: Style applied to every prompt
+            add_quality_modifiers: Used by the rule-based fallback
+            optimization_model: Model to use (default: the optimizer's model)
+            poll_interval: Seconds between job status checks
+            timeout: Seconds to wait for the job before giving up (None waits for its 24h window)
+        
+        Returns:
+            List of (enhanced_prompt, negative_prompt, metadata), in input order
+        """
+        unique = list(dict.fromkeys(prompts))
+        if len(unique) < len(prompts):
+            results = self.batch_enhance_offline(
+                unique, style_preset, add_quality_modifiers, optimization_model, poll_interval, timeout
+            )
+            return self._scatter(prompts, unique, results)
+        
+        model = optimization_model or self.optimization_model
+        starts = [self._start_enhancement(prompt, style_preset, True) for prompt in prompts]
+        
+        # One request per line; every body starts with the same system message
+        lines = []
+        for i, (prompt, (metadata, use_gpt)) in enumerate(zip(prompts, starts)):
+            if use_gpt:
+                try:
+                    request, _ = self._completion_request(prompt, style_preset, model)
+                except ValueError as e:
+                    # Too long for the model, enhanced rule-based instead
+                    metadata["gpt_enhancement_error"] = str(e)
+                    starts[i] = (metadata, False)
+                    continue
+                lines.append(json.dumps({
+                    "custom_id": str(i),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": request
+                }))
+        
+        outputs = {}
+        batch_error = None
+        if lines:
+            try:
+                outputs = self._run_offline_batch(lines, poll_interval, timeout)
+            except Exception as e:
+                logger.warning("Batch enhancement failed, using rule-based: %s", e)
+                batch_error = e
+        
+        results = []
+        for i, (prompt, (metadata, use_gpt)) in enumerate(zip(prompts, starts)):
+            enhanced_prompt = None
+            if use_gpt:
+                output = outputs.get(str(i), batch_error or RuntimeError("No result in batch output"))
+                if isinstance(output, Exception):
+                    metadata["gpt_enhancement_error"] = str(output)
+                else:
+                    enhanced_prompt = output
+                    self._record_gpt_success(metadata, model, style_preset)
+            results.append(
+                self._finish_enhancement(prompt, style_preset, add_quality_modifiers, enhanced_prompt, metadata)
+            )
         return results
-
+    
+    def _run_offline_batch(
+        self,
+        lines: List[str],
+        poll_interval: float,
+        timeout: Optional[float]
+    ) -> Dict[str, Any]:
+        """Submit JSONL request lines as a batch job and wait for it, returns custom_id -> text or error"""
+        input_file = self.client.files.create(
+            file=("prompts.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        
+        deadline = time.monotonic() + timeout if timeout else None
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Batch {batch.id} still {batch.status} after {timeout}s")
+            time.sleep(poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+        
+        # Expired jobs can still carry the requests that completed in time
+        if not batch.output_file_id:
+            raise RuntimeError(f"Batch {batch.id} {batch.status} without output")
+        
+        outputs = {}
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                outputs[item["custom_id"]] = RuntimeError(str(item.get("error") or response.get("body")))
+            else:
+                outputs[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+        return outputs
+    
     def suggest_variations(self, prompt: str, num_variations: int = 3) -> List[str]:
         """Generate variations of a prompt for diverse results"""
         base_enhanced, _, _ = self.enhance_prompt(prompt, use_gpt_enhancement=False)
@@ -420,10 +420,42 @@ STYLE_PRESETS = {
     }
 }
 
+# Preset names for display (tuple) and O(1) membership checks (frozenset)
+STYLE_PRESET_NAMES = tuple(STYLE_PRESETS)
+STYLE_PRESET_SET = frozenset(STYLE_PRESET_NAMES)
+
+# Pre-joined text the rule-based enhancer puts around a prompt:
+# name -> (prefix, suffix with the first two modifiers, suffix alone)
+STYLE_PRESET_PARTS = {
+    name: (
+        preset["prefix"],
+        ", ".join(filter(None, [*preset["modifiers"][:2], preset["suffix"]])),
+        preset["suffix"]
+    )
+    for name, preset in STYLE_PRESETS.items()
+}
+
+# Lowercase words that show a prompt already spells out a preset's style
+STYLE_KEYWORDS = {
+    name: frozenset([name.replace("_", " ")] + [modifier.lower() for modifier in preset["modifiers"]])
+    for name, preset in STYLE_PRESETS.items()
+}
+
 def get_style_list():
     """Get list of all available style names"""
-    return list(STYLE_PRESETS.keys()) + ["custom"]
+    return list(STYLE_PRESET_NAMES) + ["custom"]
+
+def is_valid_style(style_name):
+    """Check whether a name is a known preset or 'custom'"""
+    return style_name in STYLE_PRESET_SET or style_name == "custom"
 
 def get_style_preset(style_name):
     """Get a specific style preset by name"""
-    return STYLE_PRESETS.get(style_name, None)
\ No newline at end of file
+    return STYLE_PRESETS.get(style_name, None)
+
+def get_style_tail(style_name, with_modifiers=True):
+    """Get the pre-joined text that follows a prompt for a style (first two modifiers and suffix), None if unknown"""
+    parts = STYLE_PRESET_PARTS.get(style_name)
+    if parts is None:
+        return None
+    return parts[1] if with_modifiers else parts[2]
\ No newline at end of file
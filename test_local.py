@@ -7,6 +7,7 @@ Test and use the tool locally with an interactive interface
 import os
 import sys
 import json
+import logging
 import time
 from pathlib import Path
 from datetime import datetime
@@ -17,7 +18,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 from src.prompt_optimizer import PromptOptimizer
 from src.image_generator import ImageGenerator
 from src.image_processor import ImageProcessor
-from src.style_presets import get_style_list
+from src.style_presets import get_style_list, is_valid_style
 
 
 class InteractiveCLI:
@@ -29,7 +30,7 @@ class InteractiveCLI:
         self.generator = None
         self.processor = None
         self.use_gpt_image = False  # Toggle between responses API and images API
-        self.optimization_model = "gpt-5"  # Default optimization model for responses API
+        self.optimization_model = PromptOptimizer.DEFAULT_OPTIMIZATION_MODEL  # Default optimization model
         
         # Create necessary directories
         self.base_dir = Path(__file__).parent
@@ -129,14 +130,17 @@ class InteractiveCLI:
         optimization_model = None
         if optimize:
             print("\n🤖 Select optimization model:")
-            print("  1. GPT-5 (latest, most advanced - recommended)")
-            print("  2. GPT-4.1 (balanced, reliable)")
+            print("  1. GPT-4o-mini (fast, low cost - recommended)")
+            print("  2. GPT-5 (larger model)")
+            print("  3. GPT-4.1 (larger model)")
             
-            model_choice = input("Select model (1-2) [1]: ").strip()
+            model_choice = input("Select model (1-3) [1]: ").strip()
             if model_choice == "2":
+                optimization_model = "gpt-5"
+            elif model_choice == "3":
                 optimization_model = "gpt-4.1"
             else:
-                optimization_model = "gpt-5"  # Default - latest and best
+                optimization_model = PromptOptimizer.DEFAULT_OPTIMIZATION_MODEL
         
         # Style selection
         style = None
@@ -175,7 +179,7 @@ class InteractiveCLI:
                     style = display_styles[style_idx]
                 else:
                     style = "none"
-            elif style_input in all_styles:
+            elif is_valid_style(style_input):
                 style = style_input
             else:
                 style = "none"
@@ -296,30 +300,32 @@ class InteractiveCLI:
             if result["success"]:
                 print(f"\n✅ Successfully generated {len(result['images'])} image(s)!")
                 
-                # Save images
+                # Save images (written in parallel)
+                # Determine file extension based on format
+                ext = "jpg" if compress_to_jpg else "png"
+                to_save = [
+                    # Include cost in filename (e.g., generated_1_165c.png for $1.65)
+                    (img_data, self.session_output / f"generated_{i+1}_{cost_cents}c.{ext}")
+                    for i, img_data in enumerate(result["images"])
+                    if "b64_json" in img_data
+                ]
+                self.generator.save_images([(img_data["b64_json"], filepath) for img_data, filepath in to_save])
+                
                 saved_files = []
-                for i, img_data in enumerate(result["images"]):
-                    if "b64_json" in img_data:
-                        # Determine file extension based on format
-                        ext = "jpg" if compress_to_jpg else "png"
-                        # Include cost in filename (e.g., generated_1_165c.png for $1.65)
-                        filename = f"generated_{i+1}_{cost_cents}c.{ext}"
-                        filepath = self.session_output / filename
-                        
-                        self.generator.save_image(img_data["b64_json"], filepath)
-                        saved_files.append(filepath)
-                        print(f"  💾 Saved: {filepath}")
-                        
-                        # Show processing info if applied
-                        if img_data.get("format"):
-                            print(f"     Format: {img_data['format']}")
-                        if img_data.get("dimensions"):
-                            print(f"     Dimensions: {img_data['dimensions']}")
-                        if img_data.get("aspect_ratio"):
-                            print(f"     Aspect Ratio: {img_data['aspect_ratio']}")
-                        
-                        if img_data.get("revised_prompt"):
-                            print(f"  📝 Revised: {img_data['revised_prompt'][:100]}...")
+                for img_data, filepath in to_save:
+                    saved_files.append(filepath)
+                    print(f"  💾 Saved: {filepath}")
+                    
+                    # Show processing info if applied
+                    if img_data.get("format"):
+                        print(f"     Format: {img_data['format']}")
+                    if img_data.get("dimensions"):
+                        print(f"     Dimensions: {img_data['dimensions']}")
+                    if img_data.get("aspect_ratio"):
+                        print(f"     Aspect Ratio: {img_data['aspect_ratio']}")
+                    
+                    if img_data.get("revised_prompt"):
+                        print(f"  📝 Revised: {img_data['revised_prompt'][:100]}...")
                 
                 # Save metadata
                 metadata_file = self.session_output / f"metadata_{int(time.time())}.json"
@@ -411,12 +417,11 @@ class InteractiveCLI:
         # Generate
         print("\n✏️ Editing image...")
         try:
-            # Process reference images and convert to base64
-            reference_images = []
-            for img_path in selected_images:
-                # Convert image to base64
-                b64_data = self.generator.image_to_base64(str(img_path))
-                reference_images.append({"base64": b64_data})
+            # Process reference images and convert to base64 (in parallel)
+            reference_images = [
+                {"base64": b64_data}
+                for b64_data in self.generator.images_to_base64(selected_images)
+            ]
             
             result = self.generator.edit_image_with_reference(
                 prompt=prompt,
@@ -429,15 +434,16 @@ class InteractiveCLI:
             if result["success"]:
                 print(f"\n✅ Edit successful!")
                 
-                # Save result
-                for i, img_data in enumerate(result["images"]):
-                    if "b64_json" in img_data:
-                        # Include cost in filename
-                        filename = f"edited_{i+1}_{cost_cents}c.png"
-                        filepath = self.session_output / filename
-                        
-                        self.generator.save_image(img_data["b64_json"], filepath)
-                        print(f"  💾 Saved: {filepath}")
+                # Save result (written in parallel)
+                to_save = [
+                    # Include cost in filename
+                    (img_data["b64_json"], self.session_output / f"edited_{i+1}_{cost_cents}c.png")
+                    for i, img_data in enumerate(result["images"])
+                    if "b64_json" in img_data
+                ]
+                self.generator.save_images(to_save)
+                for _, filepath in to_save:
+                    print(f"  💾 Saved: {filepath}")
             else:
                 print(f"❌ Edit failed: {result.get('error')}")
                 
@@ -482,16 +488,19 @@ class InteractiveCLI:
         style_to_apply = None if selected_style == "none" else selected_style
         
         # Select optimization model
-        optimization_model = "gpt-5"  # Default to latest
+        optimization_model = PromptOptimizer.DEFAULT_OPTIMIZATION_MODEL
         if use_gpt_enhancement:
             print("\n🧠 Select optimization model:")
-            print("  1. GPT-5 (latest, most advanced)")
-            print("  2. GPT-4.1 (balanced, reliable)")
+            print("  1. GPT-4o-mini (fast, low cost - recommended)")
+            print("  2. GPT-5 (larger model)")
+            print("  3. GPT-4.1 (larger model)")
             
-            model_choice = input("Select model (1-2) [1]: ").strip()
+            model_choice = input("Select model (1-3) [1]: ").strip()
             if model_choice == "2":
+                optimization_model = "gpt-5"
+            elif model_choice == "3":
                 optimization_model = "gpt-4.1"
-            # Default is GPT-5
+            # Default is GPT-4o-mini
         
         print(f"\n⚙️ Optimizing with {selected_style if selected_style else 'no'} style...")
         if use_gpt_enhancement:
@@ -610,24 +619,27 @@ class InteractiveCLI:
         print("="*60)
         
         print(f"\n📝 Current Optimization Model: {self.optimization_model}")
-        print("\nAvailable models (for responses API):")
-        print("  1. GPT-4.1 (faster, balanced)")
-        print("  2. GPT-4 (stable)")
-        print("  3. GPT-5 (best quality, recommended)")
-        print("\nNote: gpt-4-mini only works with chat API, not responses API")
+        print("\nAvailable models:")
+        print("  1. GPT-4o-mini (fast, low cost - default, recommended)")
+        print("  2. GPT-4.1 (larger model)")
+        print("  3. GPT-4 (stable)")
+        print("  4. GPT-5 (larger model)")
         
         change = input("\nChange model? (y/n) [n]: ").strip().lower()
         if change == 'y':
-            choice = input("Select new model (1-3): ").strip()
-            if choice == "1":
+            choice = input("Select new model (1-4): ").strip()
+            if choice == "2":
                 self.optimization_model = "gpt-4.1"
                 print("✅ Changed to GPT-4.1")
-            elif choice == "2":
+            elif choice == "3":
                 self.optimization_model = "gpt-4"
                 print("✅ Changed to GPT-4")
-            else:
+            elif choice == "4":
                 self.optimization_model = "gpt-5"
                 print("✅ Changed to GPT-5")
+            else:
+                self.optimization_model = PromptOptimizer.DEFAULT_OPTIMIZATION_MODEL
+                print("✅ Changed to GPT-4o-mini")
             
             # Reinitialize optimizer with new model
             self.optimizer = PromptOptimizer(self.api_key, self.optimization_model)
@@ -674,8 +686,8 @@ class InteractiveCLI:
                 for size in ["1024x1024", "1536x1024", "1024x1536"]:
                     print(f"\n📐 Size: {size}")
                     for quality in ["low", "medium", "high"]:
-                        est = self.generator.estimate_cost(size, quality, 1)
-                        print(f"  {quality:8} : {est['output_tokens']:,} tokens")
+                        est = self.generator.cost_estimate(size, quality, 1)
+                        print(f"  {quality:8} : {est.output_tokens:,} tokens")
             elif choice == "6":
                 self.show_settings()
             elif choice == "7":
@@ -697,6 +709,10 @@ def main():
     except ImportError:
         pass  # dotenv not installed, will use system env vars
     
+    # Show library messages (crop info, enhancement fallbacks) as plain console lines
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logging.getLogger("src").setLevel(logging.INFO)
+    
     cli = InteractiveCLI()
     try:
         cli.run()
@@ -8,10 +8,11 @@ import os
 import sys
 from PIL import Image
 from pathlib import Path
+from typing import Union
 
 def compress_and_crop_image(
-    input_path: str,
-    output_path: str = None,
+    input_path: Union[str, Path],
+    output_path: Union[str, Path] = None,
     aspect_ratio: tuple = (16, 9),
     quality: int = 85,
     max_width: int = 1600
@@ -106,7 +107,8 @@ def process_batch(input_dir: str, output_dir: str = None):
     for png_file in png_files:
         output_file = output_path / f"{png_file.stem}_16x9.jpg"
         try:
-            compress_and_crop_image(str(png_file), str(output_file))
+            # PIL and os accept Path objects directly
+            compress_and_crop_image(png_file, output_file)
         except Exception as e:
             print(f"❌ Error processing {png_file}: {e}")
 